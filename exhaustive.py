@@ -2,21 +2,34 @@
 
 import os
 import sys
+import time
 import click
-import itertools
 
-import numpy as np
-from typing import Dict, List, Union
+from math import inf
 
 from dataclasses import asdict
-from scipy.optimize import differential_evolution
 
-from src.test import test
-from src.full import full
-from src.utils import analyze_result
+from src.test import (
+    TestContext,
+    test_parallel,
+    report_score,
+    report_pruned,
+)
+from src.store import ResultStore
+
+from src.configs import ConfigGrid, grid_variables
+from src.checkpoint import CHECKPOINTS_PATH, save_checkpoint, load_checkpoint
+from src.env import (
+    TICKERS,
+    BEST_CONFIGS,
+    START,
+    END,
+    CHECKPOINT_INTERVAL,
+    print_env,
+)
 
-from src.configs import Bounds, Precisions, Config
-from src.env import TICKERS, BEST_CONFIGS, START, END, print_env
+# Number of best results kept in the checkpoint
+N_BEST = 10
 
 
 @click.command()
@@ -35,7 +48,79 @@ from src.env import TICKERS, BEST_CONFIGS, START, END, print_env
     type=str,
     help="Fixed config parameters",
 )
-def exhaust(ticker, fixed):
+@click.option(
+    "--batch-size",
+    "-b",
+    required=False,
+    default=64,
+    type=int,
+    help="Number of configs to test in one pass over the chart",
+)
+@click.option(
+    "--processes",
+    "-p",
+    required=False,
+    default=os.cpu_count(),
+    type=int,
+    help="Number of worker processes",
+)
+@click.option(
+    "--shard",
+    "-s",
+    required=False,
+    default="0/1",
+    type=str,
+    help="Test i-th of n even shards of the configs (i/n)",
+)
+@click.option(
+    "--range",
+    "-r",
+    "range_",
+    required=False,
+    default="",
+    type=str,
+    help="Test configs from start to end (exclusive) only (start:end)",
+)
+@click.option(
+    "--checkpoint",
+    "-c",
+    required=False,
+    default=None,
+    type=str,
+    help="Checkpoint file (default: checkpoints/exhaustive-<ticker>-<START>,<END>-<start>,<end>.json)",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume from the checkpoint",
+)
+@click.option(
+    "--directory",
+    "-d",
+    required=False,
+    default="results",
+    type=str,
+    help="Directory to save results",
+)
+@click.option(
+    "--bounded",
+    is_flag=True,
+    default=False,
+    help="Stop simulating configs once they provably score 0 or cannot enter the best results, without storing them",
+)
+def exhaust(
+    ticker,
+    fixed,
+    batch_size,
+    processes,
+    shard,
+    range_,
+    checkpoint,
+    resume,
+    directory,
+    bounded,
+):
     print_env()
 
     if ticker not in TICKERS.keys():
@@ -47,34 +132,95 @@ def exhaust(ticker, fixed):
     except:
         raise RuntimeError(f"Invalid format for fixed")
 
-    config = BEST_CONFIGS[ticker]
-    bounds = Bounds()
-    precisions = Precisions()
-
-    variables: Dict[str, List[Union[int, float]]] = {}
-    for k, v in asdict(config).items():
-        if k in fixed:
-            tpe = type(v)
-            variables[k] = [tpe(fixed[k])]
-
-        else:
-            start, end = getattr(bounds, k)
-            precision = getattr(precisions, k)
-
-            variables[k] = [
-                start + i * precision
-                for i in range(0, int((end - start) / precision) + 1)
-            ]
+    variables = grid_variables(BEST_CONFIGS[ticker], fixed)
+    grid = ConfigGrid(variables)
 
-    combinations = list(itertools.product(*variables.values()))
-
-    configs = []
-    for c in combinations:
-        conf = Config._from(dict(zip(variables.keys(), c)))
-        configs.append(conf)
-
-    for config in configs:
-        _, _, score = test(ticker, config, START, END)
+    try:
+        start, end = range_.split(":") if range_ else ("", "")
+        start, end = int(start or 0), int(end or len(grid))
+        i, n = [int(v) for v in shard.split("/")]
+    except:
+        raise RuntimeError(f"Invalid format for shard or range")
+
+    if not 0 <= i < n:
+        raise RuntimeError(f"Invalid shard: {shard}")
+
+    start, end = max(start, 0), min(end, len(grid))
+    end = max(start, end)
+    start, end = (
+        start + (end - start) * i // n,
+        start + (end - start) * (i + 1) // n,
+    )
+    checkpoint = (
+        checkpoint
+        or f"{CHECKPOINTS_PATH}/exhaustive-{ticker}-{START},{END}-{start},{end}.json"
+    )
+    state = {
+        "ticker": ticker,
+        "start": START,
+        "end": END,
+        "variables": variables,
+        "range": [start, end],
+        "cursor": start,
+        "best": [],
+        "pruned": 0,
+    }
+
+    if resume:
+        saved = load_checkpoint(checkpoint)
+        if saved is None:
+            raise RuntimeError(f"No checkpoint: {checkpoint}")
+
+        for k in ("ticker", "start", "end", "variables", "range"):
+            if saved[k] != state[k]:
+                raise RuntimeError(f"Checkpoint of different {k}: {saved[k]}")
+
+        state = saved
+
+    print(f"Configs {state['cursor']} ~ {end} (exclusive) of {len(grid)}")
+
+    context = TestContext(ticker, START, END)
+    chunks = grid.chunks(state["cursor"], end, batch_size)
+
+    def best() -> float:
+        # Pruned configs cannot be any of the N_BEST best results
+        return state["best"][-1][0] if len(state["best"]) == N_BEST else -inf
+
+    store = ResultStore(directory)
+    saved_at = time.time()
+    for config, row in test_parallel(
+        context, chunks, processes, best if bounded else None
+    ):
+        # Results are reported in the order of the grid
+        state["cursor"] += 1
+
+        # Only configs aborted before their score is known (see
+        # `test_batch`) are not stored
+        if row is None:
+            report_pruned(ticker, config)
+            state["pruned"] += 1
+            continue
+
+        report_score(ticker, config, *row)
+        store.add(ticker, START, END, config, *row)
+
+        state["best"] = sorted(
+            state["best"] + [[row[0], asdict(config)]],
+            key=lambda b: -b[0],
+        )[:N_BEST]
+
+        if time.time() - saved_at > CHECKPOINT_INTERVAL:
+            sys.stdout.flush()
+            store.flush()
+            save_checkpoint(checkpoint, state)
+            saved_at = time.time()
+
+    if bounded:
+        print(f"Pruned {state['pruned']} configs")
+
+    sys.stdout.flush()
+    store.close()
+    save_checkpoint(checkpoint, state)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+import time
+import click
+import asyncio
+import grpc
+import backtest_pb2
+import backtest_pb2_grpc
+
+import numpy as np
+
+from typing import Iterator
+from itertools import count
+from dataclasses import asdict
+
+from src.env import BEST_CONFIGS
+
+
+def requests(
+    ticker: str, start: str, end: str, chunk_size: int, repeat: bool
+) -> Iterator[backtest_pb2.FullBacktestArg]:
+    """Requests of the best config of `ticker`. Unless `repeat`, margins
+    differ by 1e-9 per request, so that none of them is served from the
+    response cache of the server, while backtests stay the same."""
+    config = asdict(BEST_CONFIGS[ticker])
+    for k in count():
+        margin = config["margin"] + (0 if repeat else k * 1e-9)
+        yield backtest_pb2.FullBacktestArg(
+            ticker=ticker,
+            start=start,
+            end=end,
+            chunk_size=chunk_size,
+            config=backtest_pb2.Config(**{**config, "margin": margin}),
+        )
+
+
+async def run_level(
+    stub,
+    requests: Iterator[backtest_pb2.FullBacktestArg],
+    concurrency: int,
+    n: int,
+    stream: bool,
+):
+    """Sends `n` requests from `concurrency` clients at once, and returns the
+    elapsed time, the latencies of the requests and the latencies until
+    their first message."""
+    latencies = []
+    firsts = []
+    remaining = [n]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+
+            request = next(requests)
+
+            started = time.perf_counter()
+            if stream:
+                responses = stub.FullBacktestStream(request)
+            else:
+                responses = _single(await stub.FullBacktest(request))
+
+            first = None
+            async for response in responses:
+                first = first or time.perf_counter() - started
+                if response.error:
+                    raise RuntimeError(response.error)
+
+            latencies.append(time.perf_counter() - started)
+            firsts.append(first)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+    return time.perf_counter() - started, np.array(latencies), np.array(firsts)
+
+
+async def _single(response):
+    yield response
+
+
+async def benchmark(
+    address: str,
+    ticker: str,
+    start: str,
+    end: str,
+    levels,
+    n: int,
+    stream: bool,
+    chunk_size: int,
+    repeat: bool,
+):
+    reqs = requests(ticker, start, end, chunk_size, repeat)
+
+    async with grpc.aio.insecure_channel(
+        address,
+        options=[("grpc.max_receive_message_length", 64 * 1024 * 1024)],
+    ) as channel:
+        stub = backtest_pb2_grpc.MumeBacktestServerStub(channel)
+
+        # Warm up the connection
+        await stub.FullBacktest(next(reqs))
+
+        print(
+            f"{'clients':>8} {'req/s':>8} {'p50 (ms)':>10} {'p99 (ms)':>10} "
+            f"{'first p50 (ms)':>15} {'cache hits':>11} {'misses':>7}"
+        )
+        for concurrency in levels:
+            before = await stub.GetCacheStats(backtest_pb2.CacheStatsArg())
+            elapsed, latencies, firsts = await run_level(
+                stub, reqs, concurrency, max(n, concurrency), stream
+            )
+            after = await stub.GetCacheStats(backtest_pb2.CacheStatsArg())
+
+            # Coalesced requests did not run a backtest either
+            hits = (after.hits + after.coalesced) - (
+                before.hits + before.coalesced
+            )
+            misses = after.misses - before.misses
+
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            first = np.percentile(firsts, 50) * 1000
+            print(
+                f"{concurrency:>8} {len(latencies) / elapsed:>8.1f} "
+                f"{p50:>10.1f} {p99:>10.1f} {first:>15.1f} "
+                f"{hits:>11} {misses:>7}"
+            )
+
+
+@click.command()
+@click.option("--address", "-a", default="localhost:50051", type=str)
+@click.option("--ticker", "-t", default="SOXL", type=str)
+@click.option("--start", "-s", default="", type=str)
+@click.option("--end", "-e", default="", type=str)
+@click.option(
+    "--levels",
+    "-l",
+    default="1,2,4,8,16",
+    type=str,
+    help="Numbers of concurrent clients",
+)
+@click.option(
+    "--requests",
+    "-n",
+    "n",
+    default=32,
+    type=int,
+    help="Number of requests per level",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    default=False,
+    help="Request FullBacktestStream instead of FullBacktest",
+)
+@click.option(
+    "--chunk-size",
+    "-c",
+    default=0,
+    type=int,
+    help="Days per message of FullBacktestStream (0: server default)",
+)
+@click.option(
+    "--repeat",
+    is_flag=True,
+    default=False,
+    help="Send the same request every time (served from the response cache)",
+)
+def main(address, ticker, start, end, levels, n, stream, chunk_size, repeat):
+    """Throughput of FullBacktest (or FullBacktestStream) by the number of
+    concurrent clients.
+
+    Compare servers started with different numbers of processes (e.g.,
+    `server.py -p 1` and `server.py -p 8`). Requests differ from each other
+    unless --repeat, so that every FullBacktest runs a backtest even if the
+    server caches responses (cache hits are reported to make sure).
+    """
+    levels = [int(l) for l in levels.split(",")]
+    asyncio.run(
+        benchmark(
+            address,
+            ticker,
+            start,
+            end,
+            levels,
+            n,
+            stream,
+            chunk_size,
+            repeat,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -73,6 +73,42 @@ def test_full_backtest(ticker="SOXL", start_date="", end_date="", config=None):
         channel.close()
 
 
+def test_full_backtest_stream(ticker="SOXL", chunk_size=256):
+    """Test the FullBacktestStream gRPC API"""
+
+    channel = grpc.insecure_channel("localhost:50051")
+    stub = backtest_pb2_grpc.MumeBacktestServerStub(channel)
+
+    try:
+        request = backtest_pb2.FullBacktestArg(
+            ticker=ticker, chunk_size=chunk_size
+        )
+
+        print(f"Testing FullBacktestStream for {ticker} by {chunk_size} days")
+        print("-" * 60)
+
+        n_chunks, history = 0, []
+        for response in stub.FullBacktestStream(request):
+            if response.error:
+                print(f"Error: {response.error}")
+                return None
+
+            n_chunks += 1
+            history.extend(State._from(s) for s in response.history)
+
+        print(f"Received {len(history)} history entries in {n_chunks} chunks")
+        if history:
+            print(f"[{len(history)}]: {history[-1]}")
+
+        return history
+
+    except grpc.RpcError as e:
+        print(f"gRPC Error: {e.code()}: {e.details()}")
+        return None
+    finally:
+        channel.close()
+
+
 def main():
     """Main function to run various test scenarios"""
     print("=== Python gRPC Client for FullBacktest API ===\n")
@@ -96,6 +132,11 @@ def main():
     # Test 4: Test with invalid date format
     print("Test 4: Test with invalid date format")
     test_full_backtest(start_date="invalid-date", end_date="2023-12-31")
+    print()
+
+    # Test 5: Streaming test with default config
+    print("Test 5: Streaming test with default config")
+    test_full_backtest_stream()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import math
+import time
+import click
+
+import numpy as np
+from typing import Iterable, Iterator, List, Tuple
+
+from src.test import TestContext, TestPool, report_score
+from src.store import ResultStore
+
+from src.configs import Config, ConfigGrid, grid_variables
+from src.env import TICKERS, BEST_CONFIGS, START, END, CYCLE_DAYS, print_env
+
+
+def test_scores(
+    pool: TestPool, chunks: Iterable[List[Config]], stride: int
+) -> Iterator[Tuple[float, float, float, float]]:
+    """(score, avg_ror_per_year, exhaust_rate, fail_rate) of the configs in
+    `chunks` tested on every `stride`-th window."""
+    for _, row in pool.test(chunks, stride=stride):
+        yield row
+
+
+def batches(configs: List[Config], batch_size: int) -> Iterator[List[Config]]:
+    for i in range(0, len(configs), batch_size):
+        yield configs[i : i + batch_size]
+
+
+def rank(scores: np.ndarray) -> np.ndarray:
+    # Best first, ties in the order of the grid
+    return np.argsort(-scores, kind="stable")
+
+
+@click.command()
+@click.option(
+    "--ticker",
+    "-t",
+    required=False,
+    default="SOXL",
+    type=click.Choice(list(TICKERS.keys())),
+)
+@click.option(
+    "--fixed",
+    "-f",
+    required=False,
+    default="",
+    type=str,
+    help="Fixed config parameters",
+)
+@click.option(
+    "--batch-size",
+    "-b",
+    required=False,
+    default=64,
+    type=int,
+    help="Number of configs to test in one pass over the chart",
+)
+@click.option(
+    "--processes",
+    "-p",
+    required=False,
+    default=os.cpu_count(),
+    type=int,
+    help="Number of worker processes",
+)
+@click.option(
+    "--eta",
+    "-e",
+    required=False,
+    default=3,
+    type=int,
+    help="Test eta times more windows per round",
+)
+@click.option(
+    "--finalists",
+    "-n",
+    required=False,
+    default=10,
+    type=int,
+    help="Number of configs to test on every window in the last round",
+)
+@click.option(
+    "--max-stride",
+    required=False,
+    default=9,
+    type=int,
+    help="Test every max-stride-th window in the first round, which sets "
+    "the number of rounds",
+)
+@click.option(
+    "--directory",
+    "-d",
+    required=False,
+    default="results",
+    type=str,
+    help="Directory to save results of the finalists",
+)
+@click.option(
+    "--compare",
+    is_flag=True,
+    default=False,
+    help="Also test every config on every window and compare the winners",
+)
+def halve(
+    ticker,
+    fixed,
+    batch_size,
+    processes,
+    eta,
+    finalists,
+    max_stride,
+    directory,
+    compare,
+):
+    print_env()
+
+    if ticker not in TICKERS.keys():
+        raise RuntimeError(f"Unknown ticker: {ticker}")
+
+    if eta < 2 or finalists < 1 or max_stride < 1:
+        raise RuntimeError(f"Invalid eta, finalists or max-stride")
+
+    fixed = [t.split(":") for t in fixed.split(",")] if fixed else []
+    try:
+        fixed = {t[0]: t[1] for t in fixed}
+    except:
+        raise RuntimeError(f"Invalid format for fixed")
+
+    grid = ConfigGrid(grid_variables(BEST_CONFIGS[ticker], fixed))
+    context = TestContext(ticker, START, END)
+    n_windows = len(context.chart) - CYCLE_DAYS
+
+    # Round r tests configs on every eta^(n_rounds - r)-th window (at most
+    # max_stride-th), so that every round tests more windows than the last
+    # and the last one tests every window
+    n_rounds = 0
+    while eta**n_rounds < max_stride:
+        n_rounds += 1
+
+    # Configs kept shrink by the same factor per round, down to finalists
+    shrink = min(finalists / len(grid), 1) ** (1 / max(n_rounds, 1))
+
+    # Worker processes are kept across the rounds
+    with TestPool(context, processes) as pool:
+        candidates = np.arange(len(grid))
+        cost = 0.0
+
+        started = time.time()
+        for r in range(n_rounds + 1):
+            stride = min(eta ** (n_rounds - r), max_stride)
+
+            print(
+                f"Round {r}: {len(candidates)} configs, every {stride}-th "
+                f"window of {n_windows}"
+            )
+            sys.stdout.flush()
+
+            # The whole grid is streamed rather than materialized
+            if r == 0:
+                chunks = grid.chunks(0, len(grid), batch_size)
+            else:
+                configs = [grid[k] for k in candidates.tolist()]
+                chunks = batches(configs, batch_size)
+
+            rows = test_scores(pool, chunks, stride)
+            cost += len(candidates) * math.ceil(n_windows / stride)
+
+            if r < n_rounds:
+                scores = np.fromiter(
+                    (row[0] for row in rows), np.float64, len(candidates)
+                )
+                n_keep = round(len(grid) * shrink ** (r + 1))
+                candidates = candidates[rank(scores)[: max(finalists, n_keep)]]
+
+        rows = list(rows)
+        scores = np.array([row[0] for row in rows])
+        order = rank(scores)[:finalists]
+
+        elapsed = time.time() - started
+
+        # The last round tests every window, the same as `test`
+        winners = candidates[order]
+        final = scores[order]
+
+        cost /= len(grid) * n_windows
+        print(f"Finalists ({cost * 100:.1f}% cost):")
+        with ResultStore(directory) as store:
+            for k, i in zip(winners.tolist(), order.tolist()):
+                report_score(ticker, grid[k], *rows[i])
+                store.add(ticker, START, END, grid[k], *rows[i])
+
+        if not compare:
+            sys.stdout.flush()
+            return
+
+        started = time.time()
+        chunks = grid.chunks(0, len(grid), batch_size)
+        rows = test_scores(pool, chunks, 1)
+        scores = np.fromiter((row[0] for row in rows), np.float64, len(grid))
+        exhaustive_elapsed = time.time() - started
+
+    order = rank(scores)
+    ranks = np.empty(len(grid), dtype=np.int64)
+    ranks[order] = np.arange(len(grid))
+
+    k = len(winners)
+    overlap = len(set(order[:k].tolist()) & set(winners.tolist()))
+
+    print(f"====== Halving vs exhaustive ({len(grid)} configs) ======")
+    print(f"Exhaustive best: {scores[order[0]]:.2f}: {grid[order[0]]}")
+    print(
+        f"Halving best: {final[0]:.2f}: {grid[winners[0]]} "
+        f"(rank {ranks[winners[0]] + 1} in exhaustive)"
+    )
+    print(f"Top-{k} overlap: {overlap} of {k}")
+    print(
+        f"Elapsed: halving {elapsed:.1f}s, exhaustive "
+        f"{exhaustive_elapsed:.1f}s ({exhaustive_elapsed / elapsed:.1f}x)"
+    )
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    halve()
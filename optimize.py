@@ -2,18 +2,29 @@
 
 import os
 import sys
+import json
+import math
+import time
 import click
+import random
+
+from contextlib import nullcontext
 
 import numpy as np
 
-from dataclasses import asdict
-from scipy.optimize import differential_evolution
+from typing import Dict, Iterable, List, Optional, Tuple
+from dataclasses import asdict, astuple
+# Private, to save and restore the solver exactly (scipy is pinned to the
+# minor version this is tested with in requirements.txt)
+from scipy.optimize._differentialevolution import DifferentialEvolutionSolver
 
-from src.test import test
+from src.test import TestContext, TestPool, report_score, report_pruned
+from src.store import ResultStore
 from src.full import full
 from src.utils import analyze_result
 
 from src.configs import Bounds, Precisions, Config
+from src.checkpoint import CHECKPOINTS_PATH, save_checkpoint, load_checkpoint
 from src.env import TICKERS, BEST_CONFIGS, START, END, print_env
 
 
@@ -26,7 +37,11 @@ from src.env import TICKERS, BEST_CONFIGS, START, END, print_env
     help="Test-mode optimize, full-mode optimize or analyze",
 )
 @click.option(
-    "--directory", "-d", required=False, help="Directory to save results"
+    "--directory",
+    "-d",
+    required=False,
+    default="results",
+    help="Directory to save results",
 )
 @click.option(
     "--ticker", "-t", required=False, type=click.Choice(list(TICKERS.keys()))
@@ -34,13 +49,51 @@ from src.env import TICKERS, BEST_CONFIGS, START, END, print_env
 @click.option(
     "--fixed", "-f", required=False, type=str, help="Fixed config parameters"
 )
-def optimize(mode, directory, ticker, fixed):
+@click.option(
+    "--checkpoint",
+    "-c",
+    required=False,
+    default=None,
+    type=str,
+    help="Checkpoint file (default: checkpoints/optimize-<ticker>-<START>,<END>.json)",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    default=False,
+    help="Resume from the checkpoint",
+)
+@click.option(
+    "--top",
+    "-k",
+    required=False,
+    default=2,
+    type=int,
+    help="Number of best configs to show per period when analyze",
+)
+@click.option(
+    "--bounded",
+    is_flag=True,
+    default=False,
+    help="Stop simulating configs once they provably score 0, without storing them (test mode)",
+)
+@click.option(
+    "--processes",
+    "-p",
+    required=False,
+    default=os.cpu_count(),
+    type=int,
+    help="Number of worker processes to test each generation (test mode)",
+)
+def optimize(
+    mode, directory, ticker, fixed, checkpoint, resume, top, bounded, processes
+):
     print_env()
 
     if mode == "a":
         for ticker in TICKERS.keys():
             print(f"====== {ticker} ======")
-            analyze_result(directory, ticker)
+            analyze_result(directory, ticker, top)
             print(f"======================")
 
         sys.exit()
@@ -71,7 +124,10 @@ def optimize(mode, directory, ticker, fixed):
             variables.append(v)
             bounds.append(getattr(_bounds, k))
 
-    def _test(vars: np.ndarray):
+    context = TestContext(ticker, START, END) if mode == "t" else None
+    store = ResultStore(directory)
+
+    def _quantize(vars: np.ndarray) -> Config:
         vars = vars.tolist()
 
         _config = {}
@@ -85,17 +141,151 @@ def optimize(mode, directory, ticker, fixed):
             p = getattr(_precisions, k)
             _config[k] = int(v / p) * p
 
-        if mode == "t":
-            _, _, score = test(ticker, Config(**_config), START, END)
-        else:  # 'f'
-            _, score = full(
-                ticker, Config(**_config), START, END, test_mode=True
-            )
+        return Config(**_config)
+
+    # Scores of the configs tested so far in test mode. Members of the
+    # population often snap to the same config by `Precisions`.
+    memo: Dict[Tuple, float] = {}
+    stats = {"hits": 0, "tested": 0, "elapsed": 0.0}
+    # Worker processes kept across generations in test mode
+    pool: Optional[TestPool] = None
+
+    def _test_population(func, population: Iterable[np.ndarray]) -> List[float]:
+        # Map-like `workers` of the solver in place of `map(func,
+        # population)`: tests the new configs of a generation at once, on
+        # `processes` worker processes
+        configs = [_quantize(vars) for vars in population]
+
+        new: Dict[Tuple, Config] = {}
+        for _config in configs:
+            key = astuple(_config)
+            if key not in memo and key not in new:
+                new[key] = _config
+
+        stats["hits"] += len(configs) - len(new)
+        stats["tested"] += len(new)
+
+        if new:
+            started = time.time()
+
+            tests = list(new.values())
+            n_chunks = min(processes, len(tests))
+            chunks = [tests[i::n_chunks] for i in range(n_chunks)]
+
+            for _config, row in pool.test(
+                chunks, (lambda: -math.inf) if bounded else None
+            ):
+                # Aborted without any `best` only once the score is
+                # provably 0
+                if row is None:
+                    report_pruned(ticker, _config)
+                    memo[astuple(_config)] = 0
+                    continue
+
+                report_score(ticker, _config, *row)
+                store.add(ticker, START, END, _config, *row)
+                memo[astuple(_config)] = row[0]
+
+            stats["elapsed"] += time.time() - started
+            sys.stdout.flush()
+
+        return [-memo[astuple(_config)] for _config in configs]
+
+    def _test_memo(vars: np.ndarray) -> float:
+        # 't' only: objective of the solver outside of generations (e.g.,
+        # polishing the best member), memoized as well
+        return _test_population(_test_memo, [vars])[0]
+
+    def _test(vars: np.ndarray):
+        # 'f' only: full backtests add random noise to the chart, so that
+        # they are neither cached nor run in parallel
+        _, score = full(ticker, _quantize(vars), START, END, test_mode=True)
         return -score
 
-    opt = differential_evolution(_test, bounds=bounds)
+    checkpoint = (
+        checkpoint or f"{CHECKPOINTS_PATH}/optimize-{ticker}-{START},{END}.json"
+    )
+    state = {
+        "ticker": ticker,
+        "start": START,
+        "end": END,
+        "mode": mode,
+        "fixed": _fixed,
+        "bounds": bounds,
+        "nit": 0,
+    }
+
+    def save(xk: np.ndarray, convergence: float):
+        store.flush()
+
+        state["nit"] += 1
+        state["nfev"] = solver._nfev
+        state["population"] = solver.population.tolist()
+        state["population_energies"] = solver.population_energies.tolist()
+        state["rng"] = solver.random_number_generator.bit_generator.state
+        state["random"] = random.getstate()
+        state["best"] = {
+            "x": xk.tolist(),
+            "fun": float(solver.population_energies[0]),
+        }
+        save_checkpoint(checkpoint, state)
+
+    # Same as `differential_evolution(_test, bounds=bounds)`, but the solver is
+    # driven here so that its population and random state are saved after
+    # every generation and can be restored exactly. In test mode, each
+    # generation is tested at once (deferred updating) on the same processes.
+    if mode == "t":
+        func = _test_memo
+        options = {"workers": _test_population, "updating": "deferred"}
+    else:
+        func = _test
+        options = {}
+
+    with (
+        TestPool(context, processes) if mode == "t" else nullcontext()
+    ) as pool, DifferentialEvolutionSolver(
+        func, bounds, callback=save, **options
+    ) as solver:
+        solver.random_number_generator = np.random.default_rng()
+
+        if resume:
+            saved = load_checkpoint(checkpoint)
+            if saved is None:
+                raise RuntimeError(f"No checkpoint: {checkpoint}")
+
+            for k in ("ticker", "start", "end", "mode", "fixed", "bounds"):
+                if saved[k] != json.loads(json.dumps(state[k])):
+                    raise RuntimeError(
+                        f"Checkpoint of different {k}: {saved[k]}"
+                    )
+
+            state = saved
+            solver.population = np.array(state["population"])
+            solver.population_energies = np.array(state["population_energies"])
+            solver.random_number_generator.bit_generator.state = state["rng"]
+            solver._nfev = state["nfev"]
+            solver.maxiter -= state["nit"]
+
+            version, internal, gauss_next = state["random"]
+            random.setstate((version, tuple(internal), gauss_next))
+
+            print(f"Resume from generation {state['nit']}: {state['best']}")
+
+        opt = solver.solve()
+
+    store.close()
     print(f"Result: {opt.fun}, Best args: {opt.x}")
 
+    if mode == "t":
+        hits, tested = stats["hits"], stats["tested"]
+        total = hits + tested
+        saved = stats["elapsed"] / tested * hits if tested else 0
+        print(
+            f"Cache hits: {hits} of {total} evaluations "
+            f"({hits / total * 100 if total else 0:.1f}%), "
+            f"saved ~{saved:.0f}s ({total / tested if tested else 1:.2f}x)"
+        )
+
 
 if __name__ == "__main__":
     optimize()
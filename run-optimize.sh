@@ -4,6 +4,8 @@ ticker_json=${tickers:-tickers.json}
 date_str=$(date +"%Y-%m-%d")
 max_cycles=${max_cycles:-2}
 rsi_days=${rsi_days:-5}
+# Runs are in the background all at once, so each gets one process by default
+processes=${processes:-1}
 results=results-${date_str}
 
 mkdir -p ${results}
@@ -12,7 +14,7 @@ do
     for i in {1..3}
     do
 	echo "[${i}] Optimizing ${ticker}..."
-	./optimize.py -t ${ticker} --fixed term:40,sahm_threshold:1.0 > ${results}/${ticker}-${i}.dat &
+	./optimize.py -t ${ticker} -p ${processes} --fixed term:40,sahm_threshold:1.0 -c checkpoints/optimize-${ticker}-${i}.json -d ${results} > ${results}/${ticker}-${i}.dat &
     done
 done
 
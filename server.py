@@ -1,33 +1,147 @@
+import os
 import grpc
+import click
+import asyncio
 import logging
-
-from typing import List, Dict
-from concurrent import futures
+import multiprocessing
+import numpy as np
+
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    List,
+    Dict,
+    Hashable,
+    Optional,
+    Tuple,
+)
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
 from dataclasses import fields
 
 import backtest_pb2
 import backtest_pb2_grpc
 
-from src.const import StockRow, Status, State
+from src.const import StockRow, State, History
 from src.env import TICKERS, BEST_CONFIGS
 from src.configs import Config
 from src.data import (
+    Calendar,
+    date_range,
     read_chart,
     read_base_chart,
-    compute_rsi,
-    compute_volatility,
-    compute_urates,
+    read_indicator,
+    chart_version,
+    UrateTerms,
 )
-from src.full import full_backtest
+from src.full import iter_backtest
+
+
+# Days of history per message of FullBacktestStream by default
+CHUNK_SIZE = 256
+
+
+def history_to_pb2(history: History) -> List[backtest_pb2.State]:
+    # Status values are the same as the values of backtest_pb2.Status
+    names = [field.name for field in fields(State)]
+    rows = zip(*(history.column(name).tolist() for name in names))
+
+    return [backtest_pb2.State(**dict(zip(names, r))) for r in rows]
+
+
+class ResponseCache:
+    """Bounded LRU cache of responses.
+
+    Concurrent misses of the same key wait for a single computation
+    (single-flight), whose result is cached if `cacheable`.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._entries: OrderedDict[Hashable, Any] = OrderedDict()
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool],
+    ) -> Any:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        task = asyncio.ensure_future(compute())
+        self._pending[key] = task
+
+        def done(task: asyncio.Future):
+            del self._pending[key]
+            if task.cancelled() or task.exception() is not None:
+                return
+
+            if self.capacity and cacheable(task.result()):
+                self._put(key, task.result())
+
+        # Computed to the end even if the requests waiting for it are
+        # cancelled
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def _put(self, key: Hashable, value: Any):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
 
 
 class MumeBacktestServer(backtest_pb2_grpc.MumeBacktestServerServicer):
+    """Requests are validated and responses encoded on the event loop, which
+    loads the calendars only with `initialize_calendars`, while backtests
+    run on `executor`, whose workers load the charts and indicators with
+    `initialize`."""
 
     CHARTS: Dict[str, List[StockRow]] = {}
-    BASE_CHARTS: Dict[str, List[StockRow]] = {}
-    RSIS: Dict[str, Dict[str, float]] = {}
-    VOLATILITIS: Dict[str, Dict[str, float]] = {}
-    URATES: Dict[str, Dict[str, float]] = {}
+    CALENDARS: Dict[str, Calendar] = {}
+    # Following arrays are aligned to CALENDARS[ticker]
+    BASE_CLOSES: Dict[str, np.ndarray] = {}
+    RSIS: Dict[str, np.ndarray] = {}
+    VOLATILITIS: Dict[str, np.ndarray] = {}
+    URATES: Dict[str, UrateTerms] = {}
+    # Indices of the last base price found up to each day, and of the first
+    # one found from each day (len(calendar) if none)
+    LAST_BASES: Dict[str, np.ndarray] = {}
+    NEXT_BASES: Dict[str, np.ndarray] = {}
+    # Content hashes of the charts loaded
+    VERSIONS: Dict[str, str] = {}
+
+    def __init__(self, executor: Executor, cache_size: int = 0):
+        self.executor = executor
+        self.cache = ResponseCache(cache_size)
+
+    @classmethod
+    def initialize_calendars(cls):
+        # Only what the event loop reads (`get_span` and the cache keys)
+        for ticker in TICKERS.keys():
+            cls.CALENDARS[ticker] = Calendar(read_chart(ticker, "", ""))
+            cls.VERSIONS[ticker] = chart_version(ticker)
 
     @classmethod
     def initialize(cls):
@@ -36,74 +150,93 @@ class MumeBacktestServer(backtest_pb2_grpc.MumeBacktestServerServicer):
 
             chart = read_chart(ticker, "", "")
             base_chart = read_base_chart(base_ticker, "", "")
+            calendar = Calendar(chart)
 
             cls.CHARTS[ticker] = chart
-            cls.BASE_CHARTS[ticker] = base_chart
-            cls.RSIS[ticker] = compute_rsi(chart, 5)
-            cls.VOLATILITIS[ticker] = compute_volatility(chart, 5)
-            cls.URATES[ticker] = compute_urates(chart, 50, 40)
-
-    def get_chart(self, ticker: str, start: str, end: str) -> List[StockRow]:
-        chart = self.CHARTS[ticker]
-
-        sidx = (
-            [int(c.date.startswith(start)) for c in chart].index(1)
-            if start
-            else 0
-        )
-        eidx = (
-            "".join(str(int(c.date.startswith(end))) for c in chart).rindex("1")
-            if end
-            else len(chart) - 1
-        )
-
-        return chart[sidx : eidx + 1]
+            cls.CALENDARS[ticker] = calendar
+            cls.BASE_CLOSES[ticker] = calendar.align_chart(base_chart)
 
-    def get_base_chart(
-        self, ticker: str, start: str, end: str
-    ) -> List[StockRow]:
-        chart = self.BASE_CHARTS[ticker]
-
-        sidx = (
-            [int(c.date.startswith(start)) for c in chart].index(1)
-            if start
-            else 0
-        )
-        eidx = (
-            "".join(str(int(c.date.startswith(end))) for c in chart).rindex("1")
-            if end
-            else len(chart) - 1
-        )
+            found = ~np.isnan(cls.BASE_CLOSES[ticker])
+            days = np.arange(len(calendar))
+            cls.LAST_BASES[ticker] = np.maximum.accumulate(
+                np.where(found, days, -1)
+            )
+            cls.NEXT_BASES[ticker] = np.minimum.accumulate(
+                np.where(found, days, len(calendar))[::-1]
+            )[::-1]
 
-        return chart[sidx : eidx + 1]
+            cls.RSIS[ticker] = read_indicator(ticker, "rsis", 5)
+            cls.VOLATILITIS[ticker] = read_indicator(ticker, "volatilities", 5)
+            cls.URATES[ticker] = UrateTerms(ticker)
+            cls.VERSIONS[ticker] = chart_version(ticker)
 
-    def FullBacktest(self, request, context):
+    @classmethod
+    def base_rors(
+        cls, ticker: str, span: slice, days: slice
+    ) -> Optional[np.ndarray]:
+        """RoRs of the base chart on `days` since its first price in `span`
+        (both absolute), the same as `src.full.base_rors` over the whole
+        span sliced to `days`, in O(days)."""
+        first = cls.NEXT_BASES[ticker][span.start]
+        if first >= span.stop:
+            return None
 
-        def state_to_pb2(s: State) -> backtest_pb2.State:
-            kwargs = {}
+        base_closes = cls.BASE_CLOSES[ticker]
+        last = cls.LAST_BASES[ticker][days]
 
-            for field in fields(s):
-                val = getattr(s, field.name, field.default)
-                kwargs[field.name] = (
-                    getattr(backtest_pb2.Status, val.name.upper())
-                    if isinstance(val, Status)
-                    else val
-                )
+        # Days before the first base price in `span` keep 0
+        base_prices = np.where(last >= span.start, base_closes[last], 0)
 
-            return backtest_pb2.State(**kwargs)
+        return (base_prices / base_closes[first]) - 1
 
+    @classmethod
+    def backtest(
+        cls,
+        ticker: str,
+        span: slice,
+        config: Config,
+        offset: int = 0,
+        size: Optional[int] = None,
+        s: Optional[State] = None,
+    ) -> Tuple[Dict[str, np.ndarray], State]:
+        """Columns of the history of `size` days from `offset` of `span`
+        (all if None), continued from `s`, and its last state (run in a
+        worker of the executor)."""
+        start = span.start + offset
+        stop = min(start + size, span.stop) if size is not None else span.stop
+        days = slice(start, stop)
+
+        chart = cls.CHARTS[ticker][days]
+        history = History(capacity=len(chart))
+        for s in iter_backtest(
+            config,
+            chart,
+            cls.URATES[ticker][config.term][days],
+            cls.RSIS[ticker][days],
+            cls.VOLATILITIS[ticker][days],
+            rors=cls.base_rors(ticker, span, days),
+            s=s,
+        ):
+            history.append(s)
+
+        return {f.name: history.column(f.name) for f in fields(State)}, s
+
+    def get_span(self, ticker: str, start: str, end: str) -> slice:
+        return date_range(self.CALENDARS[ticker].dates, start, end, strict=True)
+
+    def parse(self, request) -> Tuple[Optional[str], slice, Config]:
+        """(error, span, config) of a FullBacktestArg."""
         ticker = request.ticker
         if not ticker in TICKERS:
-            return backtest_pb2.HistoryWithErr(
-                error=f"{request.ticker} not supported"
-            )
+            return f"{request.ticker} not supported", None, None
 
         try:
-            chart = self.get_chart(ticker, request.start, request.end)
-            base_chart = self.get_base_chart(ticker, request.start, request.end)
+            span = self.get_span(ticker, request.start, request.end)
         except ValueError:
-            return backtest_pb2.HistoryWithErr(
-                error=f"start='{request.start}', end='{request.end}' not supported"
+            return (
+                f"start='{request.start}', end='{request.end}' not supported",
+                None,
+                None,
             )
 
         config = (
@@ -111,43 +244,156 @@ class MumeBacktestServer(backtest_pb2_grpc.MumeBacktestServerServicer):
             if request.HasField("config")
             else BEST_CONFIGS[request.ticker]
         )
+        if config.term < 1:
+            return f"term={config.term} not supported", None, None
+
+        return None, span, config
 
+    async def FullBacktest(self, request, context):
+        error, span, config = self.parse(request)
+        if error:
+            return backtest_pb2.HistoryWithErr(error=error)
+
+        # Encoded responses are cached by the resolved date range (e.g., ""
+        # and "2026" may be the same), unless they are errors
+        ticker = request.ticker
+        key = (ticker, span.start, span.stop, config, self.VERSIONS[ticker])
+
+        return await self.cache.get(
+            key,
+            lambda: self.full_backtest(ticker, span, config),
+            lambda response: not response.HasField("error"),
+        )
+
+    async def full_backtest(
+        self, ticker: str, span: slice, config: Config
+    ) -> backtest_pb2.HistoryWithErr:
         try:
             # Generate history
-            history = full_backtest(
-                config,
-                chart,
-                self.URATES[ticker],
-                self.RSIS[ticker],
-                self.VOLATILITIS[ticker],
-                base_chart=base_chart,
+            columns, _ = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.backtest, ticker, span, config
             )
-            history = [state_to_pb2(s) for s in history]
-
-            return backtest_pb2.HistoryWithErr(history=history)
+            history = History._view(columns)
+            return backtest_pb2.HistoryWithErr(history=history_to_pb2(history))
 
         except Exception as e:
             return backtest_pb2.HistoryWithErr(error=f"Server error: {str(e)}")
 
+    async def FullBacktestStream(self, request, context):
+        error, span, config = self.parse(request)
+        if error:
+            yield backtest_pb2.HistoryWithErr(error=error)
+            return
+
+        chunk_size = request.chunk_size or CHUNK_SIZE
+        if chunk_size < 1:
+            yield backtest_pb2.HistoryWithErr(
+                error=f"chunk_size={chunk_size} not supported"
+            )
+            return
+
+        # Each chunk is a task of its own, continued from the last state of
+        # the previous one, so that it is sent as soon as it is simulated
+        loop = asyncio.get_running_loop()
+        s = None
+        for offset in range(0, span.stop - span.start, chunk_size):
+            try:
+                columns, s = await loop.run_in_executor(
+                    self.executor,
+                    self.backtest,
+                    request.ticker,
+                    span,
+                    config,
+                    offset,
+                    chunk_size,
+                    s,
+                )
+            except Exception as e:
+                yield backtest_pb2.HistoryWithErr(
+                    error=f"Server error: {str(e)}"
+                )
+                return
+
+            history = History._view(columns)
+            yield backtest_pb2.HistoryWithErr(history=history_to_pb2(history))
+
+    async def GetCacheStats(self, request, context):
+        return backtest_pb2.CacheStats(
+            hits=self.cache.hits,
+            misses=self.cache.misses,
+            evictions=self.cache.evictions,
+            coalesced=self.cache.coalesced,
+            size=len(self.cache),
+            capacity=self.cache.capacity,
+        )
+
+
+def _ready() -> int:
+    return os.getpid()
 
-def serve():
+
+async def serve(processes: int, port: int, cache_size: int):
     """Start the gRPC server"""
-    MumeBacktestServer.initialize()
+    MumeBacktestServer.initialize_calendars()
+
+    # Workers are spawned rather than forked from the process running gRPC
+    executor = ProcessPoolExecutor(
+        processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=MumeBacktestServer.initialize,
+    )
 
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # Start every worker before serving, so that no request waits for one
+    # to load the charts
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(
+        *(loop.run_in_executor(executor, _ready) for _ in range(processes))
+    )
+
+    server = grpc.aio.server()
     backtest_pb2_grpc.add_MumeBacktestServerServicer_to_server(
-        MumeBacktestServer(), server
+        MumeBacktestServer(executor, cache_size), server
     )
 
-    listen_addr = "[::]:50051"
+    listen_addr = f"[::]:{port}"
     server.add_insecure_port(listen_addr)
 
-    logging.basicConfig(level=logging.INFO)
-    logging.info(f"Starting gRPC server on {listen_addr}")
+    logging.info(
+        f"Starting gRPC server on {listen_addr} ({processes} processes)"
+    )
 
-    server.start()
-    server.wait_for_termination()
+    await server.start()
+    try:
+        await server.wait_for_termination()
+    finally:
+        await server.stop(None)
+        executor.shutdown()
+
+
+@click.command()
+@click.option(
+    "--processes",
+    "-p",
+    required=False,
+    default=os.cpu_count(),
+    type=click.IntRange(min=1),
+    help="Number of worker processes running backtests",
+)
+@click.option(
+    "--port", required=False, default=50051, type=int, help="Port to listen"
+)
+@click.option(
+    "--cache-size",
+    "-c",
+    required=False,
+    default=64,
+    type=click.IntRange(min=0),
+    help="Number of FullBacktest responses to cache (0 to disable)",
+)
+def main(processes, port, cache_size):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(serve(processes, port, cache_size))
 
 
 if __name__ == "__main__":
-    serve()
+    main()
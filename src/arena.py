@@ -0,0 +1,75 @@
+from typing import Dict, Hashable, List, Tuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# (key, dtype, shape, offset) of an array in the arena
+ArraySpec = Tuple[Hashable, np.dtype, Tuple[int, ...], int]
+
+ALIGNMENT = 64
+
+
+class SharedArena:
+    """Named arrays packed into one `multiprocessing.shared_memory` block.
+
+    The process that creates the arena copies the arrays in once and unlinks
+    the block on `close`. Worker processes `attach` by `name` and `specs`
+    (both picklable) and read the arrays without copying them.
+    """
+
+    def __init__(
+        self,
+        shm: shared_memory.SharedMemory,
+        specs: List[ArraySpec],
+        owner: bool,
+    ):
+        self.shm = shm
+        self.specs = specs
+        self.owner = owner
+
+        self.arrays: Dict[Hashable, np.ndarray] = {}
+        for key, dtype, shape, offset in specs:
+            array = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            array.flags.writeable = False
+            self.arrays[key] = array
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, arrays: Dict[Hashable, np.ndarray]) -> "SharedArena":
+        specs: List[ArraySpec] = []
+        size = 0
+        for key, array in arrays.items():
+            specs.append((key, array.dtype, array.shape, size))
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for (_, _, _, offset), array in zip(specs, arrays.values()):
+            view = np.ndarray(
+                array.shape, dtype=array.dtype, buffer=shm.buf, offset=offset
+            )
+            view[...] = array
+
+        return cls(shm, specs, owner=True)
+
+    @classmethod
+    def attach(cls, name: str, specs: List[ArraySpec]) -> "SharedArena":
+        return cls(shared_memory.SharedMemory(name=name), specs, owner=False)
+
+    def __getitem__(self, key: Hashable) -> np.ndarray:
+        return self.arrays[key]
+
+    def close(self):
+        # Views must be released before the buffer can be closed
+        self.arrays.clear()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,308 @@
+from typing import List, Tuple, Union, Optional
+from dataclasses import dataclass, fields
+
+import numpy as np
+
+from .configs import Config
+from .const import SeedExhausted, StockRow, Status, Result
+from .env import COMMISSION_RATE
+
+# Vectorized counterpart of `sim.oneday` for the sliding window test.
+# Every window is a lane and all lanes step through one day together, so the
+# arithmetic below must stay in the same order as `State.sell`, `State.buy`
+# and `State.complete` to produce bit-identical results.
+# BOXX is not modeled (test mode does not support it).
+
+BUYING = Status.Buying.value
+SOLD = Status.Sold.value
+EXHAUSTED = Status.Exhausted.value
+
+
+@dataclass
+class ConfigBatch:
+    """`Config` with an array axis, one entry per config (or per lane)."""
+
+    term: np.ndarray
+    margin: np.ndarray
+    bullish_rsi: np.ndarray
+    burst_urate: np.ndarray
+    burst_scale: np.ndarray
+    burst_vol: np.ndarray
+    sell_base: np.ndarray
+    sell_limit: np.ndarray
+    sahm_threshold: np.ndarray
+
+    @classmethod
+    def _from(cls, configs: List[Config]) -> "ConfigBatch":
+        kwargs = {}
+        for field in fields(Config):
+            kwargs[field.name] = np.array(
+                [getattr(c, field.name) for c in configs]
+            )
+        return cls(**kwargs)
+
+    def __len__(self):
+        return len(self.term)
+
+    def take(self, idx: np.ndarray) -> "ConfigBatch":
+        kwargs = {}
+        for field in fields(self):
+            kwargs[field.name] = getattr(self, field.name)[idx]
+        return ConfigBatch(**kwargs)
+
+
+@dataclass
+class Lanes:
+    """State of each lane of `simulate_batch` on its `day`-th day.
+
+    Lanes that failed a cycle keep the state from which the next cycle
+    continues: the state before the day they got exhausted (which is
+    simulated again with a larger `max_cycle`), or the state after the last
+    day of the window.
+    """
+
+    day: np.ndarray
+    seed: np.ndarray
+    invested: np.ndarray
+    remaining: np.ndarray
+    qty: np.ndarray
+    status: np.ndarray
+    cycle: np.ndarray
+    avg_price: np.ndarray
+
+    @classmethod
+    def init(cls, n_lanes: int, seed: float) -> "Lanes":
+        return cls(
+            day=np.zeros(n_lanes, dtype=np.int64),
+            seed=np.full(n_lanes, float(seed)),
+            invested=np.zeros(n_lanes),
+            remaining=np.full(n_lanes, float(seed)),
+            qty=np.zeros(n_lanes),
+            status=np.full(n_lanes, BUYING, dtype=np.int64),
+            cycle=np.zeros(n_lanes, dtype=np.int64),
+            avg_price=np.zeros(n_lanes),
+        )
+
+    def __len__(self):
+        return len(self.day)
+
+    def take(self, idx: np.ndarray) -> "Lanes":
+        kwargs = {}
+        for field in fields(self):
+            kwargs[field.name] = getattr(self, field.name)[idx]
+        return Lanes(**kwargs)
+
+    def put(self, idx: np.ndarray, other: "Lanes"):
+        for field in fields(self):
+            getattr(self, field.name)[idx] = getattr(other, field.name)
+
+
+def simulate_batch(
+    chart: List[StockRow],
+    starts: np.ndarray,
+    n_days: int,
+    max_cycle: int,
+    config: Union[Config, ConfigBatch],
+    urates: np.ndarray,
+    rsis: np.ndarray,
+    volatilities: np.ndarray,
+    seed: float,
+    lanes: Optional[Lanes] = None,
+) -> Tuple[List[Result], int, Lanes]:
+    """Simulate windows `chart[start : start + n_days]` for every start.
+
+    Indicator arrays are aligned to `chart`. `config` is either a single
+    `Config` shared by all windows or a `ConfigBatch` with one entry per
+    start, so that many configs can be simulated in one pass. Returns one
+    `Result` per start (in the given order), the number of retired windows,
+    i.e., windows that neither sold nor got exhausted until their last day,
+    and the `Lanes` to continue the windows that did not sell from.
+
+    Windows start from `lanes` if given (e.g., those returned for the
+    previous cycle), which gives the same results as simulating them from
+    their first day, since `max_cycle` does not matter until a window gets
+    exhausted in its last cycle.
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    n_lanes = len(starts)
+    assert n_lanes == 0 or starts.max() + n_days <= len(chart)
+
+    if isinstance(config, Config):
+        config = ConfigBatch._from([config]).take(np.zeros(n_lanes, dtype=int))
+    assert len(config) == n_lanes
+
+    if lanes is None:
+        lanes = Lanes.init(n_lanes, seed)
+    assert len(lanes) == n_lanes
+
+    closes = np.array([c.close_price for c in chart], dtype=np.float64)
+
+    # Per-lane outputs, indexed by the original lane id
+    end_offset = np.full(n_lanes, n_days - 1, dtype=np.int64)
+    final_status = np.full(n_lanes, BUYING, dtype=np.int64)
+    final_ror = np.zeros(n_lanes, dtype=np.float64)
+    continued = lanes.take(np.arange(n_lanes))
+
+    # Per-lane state of live lanes only (finished lanes are compacted out)
+    lane = np.arange(n_lanes)
+    base = starts.copy()
+    day = lanes.day.copy()
+    seed_ = lanes.seed.copy()
+    invested = lanes.invested.copy()
+    remaining = lanes.remaining.copy()
+    qty = lanes.qty.copy()
+    status = lanes.status.copy()
+    cycle = lanes.cycle.copy()
+    avg_price = lanes.avg_price.copy()
+    ror = np.zeros(n_lanes)
+
+    # Lanes that have already reached the last day
+    live = day < n_days
+    if not np.all(live):
+        lane, base, day = lane[live], base[live], day[live]
+        seed_, invested = seed_[live], invested[live]
+        remaining, qty = remaining[live], qty[live]
+        status, cycle = status[live], cycle[live]
+        avg_price, ror = avg_price[live], ror[live]
+        config = config.take(live)
+
+    while len(lane) > 0:
+        prev = Lanes(
+            day, seed_, invested, remaining, qty, status, cycle, avg_price
+        )
+
+        idx = base + day
+        cp = closes[idx]
+        rsi = rsis[idx]
+        vol = volatilities[idx]
+        urate = urates[idx]
+
+        daily_seed = seed_ / config.term
+
+        sell_all = (qty > 0) & (cp > avg_price * (1 + config.margin))
+        buying = ~sell_all
+
+        dqtyD = daily_seed / cp
+        if np.any(buying & (dqtyD < 1)):
+            raise SeedExhausted
+
+        rate = np.where(rsi > config.bullish_rsi, 0.0, 1.0)
+        burst = (
+            (urate < config.burst_urate)
+            & (vol < 0)
+            & (np.abs(vol) > config.burst_vol)
+        )
+        rate = np.where(
+            burst,
+            rate
+            * (
+                1
+                + config.burst_scale
+                * (np.abs(vol) - config.burst_vol)
+                / config.burst_vol
+            ),
+            rate,
+        )
+        dqty = np.trunc(dqtyD * rate)
+
+        short = buying & (remaining < cp)
+        partial = short & (cycle < max_cycle)
+        exhaust = short & ~partial
+        buy_full = buying & ~short & (remaining >= dqty * cp)
+        buy_rest = buying & ~short & ~buy_full
+
+        # Sell (State.sell)
+        sell_rate = config.sell_base + (
+            config.sell_limit - config.sell_base
+        ) * (1 - urate)
+        sell_qty = np.where(
+            partial, np.trunc(qty * sell_rate), np.where(short, qty, 0.0)
+        )
+        sell_qty = np.where(sell_all, qty, sell_qty)
+        selling = sell_all | short
+
+        s_comm = sell_qty * cp * COMMISSION_RATE
+        invested = np.where(selling, invested - sell_qty * avg_price, invested)
+        remaining = np.where(
+            selling, remaining + (sell_qty * cp - s_comm), remaining
+        )
+        seed_ = np.where(sell_all, remaining, seed_)
+        qty = np.where(selling, qty - sell_qty, qty)
+        status = np.where(
+            sell_all, SOLD, np.where(short, EXHAUSTED, BUYING)
+        )
+        cycle = np.where(
+            sell_all | exhaust, 0, np.where(partial, cycle + 1, cycle)
+        )
+
+        # Buy (State.buy)
+        buy_qty = np.where(
+            buy_full, dqty, np.where(buy_rest, np.trunc(remaining / cp), 0.0)
+        )
+        bought = buy_full | buy_rest
+
+        b_comm = buy_qty * cp * COMMISSION_RATE
+        invested = np.where(bought, invested + buy_qty * cp, invested)
+        remaining = np.where(
+            bought, remaining - (buy_qty * cp + b_comm), remaining
+        )
+        qty = np.where(bought, qty + buy_qty, qty)
+
+        # Complete (State.complete)
+        held = qty > 0
+        avg_price = np.divide(
+            invested, qty, out=np.zeros_like(invested), where=held
+        )
+        stock_eval = np.where(held, qty * cp, 0.0)
+        ror = (remaining + stock_eval) / seed - 1
+
+        day = day + 1
+
+        done = (status == SOLD) | ((status == EXHAUSTED) & (cycle == 0))
+        retired = ~done & (day == n_days)
+        if np.any(done | retired):
+            ended = lane[done]
+            end_offset[ended] = day[done] - 1
+            final_status[ended] = status[done]
+            final_ror[ended] = ror[done]
+
+            # Exhausted lanes continue from the day they got exhausted
+            exhausted = done & (status == EXHAUSTED)
+            continued.put(lane[exhausted], prev.take(exhausted))
+
+            final_status[lane[retired]] = status[retired]
+            final_ror[lane[retired]] = ror[retired]
+            continued.put(
+                lane[retired],
+                Lanes(
+                    day, seed_, invested, remaining, qty, status, cycle,
+                    avg_price,
+                ).take(retired),
+            )
+
+            keep = ~(done | retired)
+            lane, base, day = lane[keep], base[keep], day[keep]
+            seed_, invested = seed_[keep], invested[keep]
+            remaining, qty = remaining[keep], qty[keep]
+            status, cycle = status[keep], cycle[keep]
+            avg_price, ror = avg_price[keep], ror[keep]
+            config = config.take(keep)
+
+    results = [
+        Result(
+            start=chart[s].date,
+            end=chart[s + e].date,
+            sold=bool(st == SOLD),
+            ror=float(r),
+        )
+        for s, e, st, r in zip(
+            starts.tolist(),
+            end_offset.tolist(),
+            final_status.tolist(),
+            final_ror.tolist(),
+        )
+    ]
+    n_retired = int(np.count_nonzero(final_status == BUYING))
+
+    return results, n_retired, continued
@@ -0,0 +1,26 @@
+import os
+import json
+
+from typing import Any, Dict, Optional
+
+CHECKPOINTS_PATH = "checkpoints"
+
+
+def save_checkpoint(path: str, state: Dict[str, Any]):
+    """Write `state` as JSON, replacing the previous checkpoint atomically,
+    so that a run killed while saving still leaves a valid checkpoint."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as fd:
+        json.dump(state, fd)
+    os.replace(tmp, path)
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, Any]]:
+    """State saved by `save_checkpoint` (None if there is no checkpoint)."""
+    try:
+        with open(path, "r") as fd:
+            return json.load(fd)
+    except FileNotFoundError:
+        return None
@@ -1,6 +1,6 @@
 import json
 
-from typing import Tuple, Dict, Union, Any
+from typing import Tuple, Dict, List, Union, Any, Iterator
 from dataclasses import dataclass, asdict, fields
 
 
@@ -84,3 +84,72 @@ class Config:
             l.append(f"{k}: {vs}")
 
         return ", ".join(l)
+
+
+def grid_variables(
+    config: Config, fixed: Dict[str, str]
+) -> Dict[str, List[Union[int, float]]]:
+    """Candidate values of each field of `config`: the `fixed` value, or
+    every value within `Bounds` by `Precisions`."""
+    bounds = Bounds()
+    precisions = Precisions()
+
+    variables: Dict[str, List[Union[int, float]]] = {}
+    for k, v in asdict(config).items():
+        if k in fixed:
+            tpe = type(v)
+            variables[k] = [tpe(fixed[k])]
+
+        else:
+            start, end = getattr(bounds, k)
+            precision = getattr(precisions, k)
+
+            variables[k] = [
+                start + i * precision
+                for i in range(0, int((end - start) / precision) + 1)
+            ]
+
+    return variables
+
+
+class ConfigGrid:
+    """Product of candidate values of each `Config` field, never materialized.
+
+    Configs are numbered in the order of `itertools.product` over the fields
+    (i.e., the last field changes fastest), and config number k is computed
+    directly from k. Therefore, ranges of the grid can be split across
+    processes or machines without coordination.
+    """
+
+    def __init__(self, variables: Dict[str, List[Union[int, float]]]):
+        self.names = [field.name for field in fields(Config)]
+        self.values = [list(variables[name]) for name in self.names]
+
+        self.strides: List[int] = []
+        size = 1
+        for values in reversed(self.values):
+            self.strides.insert(0, size)
+            size *= len(values)
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, k: int) -> Config:
+        if k < 0:
+            k += self.size
+        if not 0 <= k < self.size:
+            raise IndexError(f"config {k} out of {self.size}")
+
+        kwargs = {}
+        for name, values, stride in zip(self.names, self.values, self.strides):
+            kwargs[name] = values[(k // stride) % len(values)]
+
+        return Config(**kwargs)
+
+    def chunks(
+        self, start: int, end: int, size: int
+    ) -> Iterator[List[Config]]:
+        """Configs [start, end) in lists of (at most) `size` configs."""
+        for i in range(start, end, size):
+            yield [self[k] for k in range(i, min(i + size, end))]
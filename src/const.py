@@ -1,13 +1,21 @@
 from typing import List, Union, Dict, Any
 from dataclasses import dataclass, astuple, fields
-from copy import deepcopy
 from enum import Enum
+from functools import lru_cache
+from operator import attrgetter
 
 from datetime import datetime
 
+import numpy as np
+
 from .env import MARKET_DAYS_PER_YEAR, COMMISSION_RATE, BOXX, BOXX_UNIT, BOXX_IR
 
 
+@lru_cache(maxsize=None)
+def date_ordinal(date: str) -> int:
+    return datetime.strptime(date, "%Y-%m-%d").toordinal()
+
+
 class SeedExhausted(Exception):
     pass
 
@@ -34,7 +42,7 @@ class StockRow:
         return iter(astuple(self))
 
 
-@dataclass
+@dataclass(slots=True)
 class State:
     date: str
     elapsed: int
@@ -111,15 +119,25 @@ class State:
 
     @classmethod
     def from_(cls, s: "State", c: StockRow) -> "State":
-        new_s = deepcopy(s)
-
-        new_s.date = c.date
-        new_s.elapsed += 1
-        new_s.price = c.price
-        new_s.close_price = c.close_price
+        new_s = s.snapshot()
+        new_s.advance(c)
 
         return new_s
 
+    def snapshot(self) -> "State":
+        # All fields are immutable, so a shallow copy is a full snapshot
+        s = State.__new__(State)
+        for name in self.__slots__:
+            setattr(s, name, getattr(self, name))
+
+        return s
+
+    def advance(self, c: StockRow):
+        self.date = c.date
+        self.elapsed += 1
+        self.price = c.price
+        self.close_price = c.close_price
+
     def __str__(self):
         if not self.date:
             return ""
@@ -229,11 +247,104 @@ class State:
         self.base_ror = 0
 
 
-class History(List[State]):
+class History:
+    """Columnar history of daily `State`s, one NumPy column per field.
+
+    Rows are materialized as `State` only when accessed, while `column`
+    exposes the underlying arrays (without copy) for aggregations, plots and
+    protobuf packing.
+    """
+
+    DTYPES = {str: "U10", int: np.int64, float: np.float64, Status: np.int8}
+
+    def __init__(self, capacity: int = 0):
+        self._len = 0
+        self._columns: Dict[str, np.ndarray] = {
+            field.name: np.empty(capacity, dtype=self.DTYPES[field.type])
+            for field in fields(State)
+        }
+
+        # Appended rows are buffered as tuples and moved into the columns
+        # on the next read, which is much cheaper than per-item assignment
+        self._pending: List[tuple] = []
+        self._getter = attrgetter(*self._columns.keys())
+
+    @classmethod
+    def _view(cls, columns: Dict[str, np.ndarray]) -> "History":
+        h = cls.__new__(cls)
+        h._columns = columns
+        h._len = len(columns["date"])
+        h._pending = []
+        h._getter = attrgetter(*columns.keys())
+
+        return h
+
     def append(self, s: State):
         assert isinstance(s, State)
 
-        super().append(s)
+        self._pending.append(self._getter(s))
+
+    def _flush(self):
+        if not self._pending:
+            return
+
+        n = self._len + len(self._pending)
+        for (name, col), vals in zip(
+            self._columns.items(), zip(*self._pending)
+        ):
+            if len(col) < n:
+                new_col = np.empty(max(n, 2 * len(col)), dtype=col.dtype)
+                new_col[: self._len] = col[: self._len]
+                self._columns[name] = col = new_col
+
+            if name == "status":
+                vals = [v.value for v in vals]
+            col[self._len : n] = vals
+
+        self._len = n
+        self._pending = []
+
+    def column(self, name: str) -> np.ndarray:
+        self._flush()
+        return self._columns[name][: self._len]
+
+    def between(self, start: str, end: str) -> "History":
+        """Rows dated from `start` to `end` ('yyyy' or 'yyyy-mm' allowed)."""
+        dates = self.column("date")
+        sidx = np.searchsorted(dates, start, side="left") if start else 0
+        eidx = (
+            np.searchsorted(dates, end + "\uffff", side="right")
+            if end
+            else len(dates)
+        )
+
+        return self[sidx:eidx]
+
+    def __len__(self):
+        return self._len + len(self._pending)
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union[State, "History"]:
+        if isinstance(idx, slice):
+            return History._view(
+                {name: self.column(name)[idx] for name in self._columns}
+            )
+
+        self._flush()
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError("history index out of range")
+
+        s = State.__new__(State)
+        for name, col in self._columns.items():
+            setattr(s, name, col[idx].item())
+        s.status = Status(s.status)
+
+        return s
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
 
     def __str__(self):
         return "\n".join(str(s) for s in self)
@@ -249,7 +360,4 @@ class Result:
 
     @property
     def days(self) -> int:
-        start: datetime = datetime.strptime(self.start, "%Y-%m-%d")
-        end: datetime = datetime.strptime(self.end, "%Y-%m-%d")
-
-        return (end - start).days
+        return date_ordinal(self.end) - date_ordinal(self.start)
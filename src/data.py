@@ -1,90 +1,227 @@
+import os
 import csv
+import hashlib
 
-from typing import List, Dict
+from bisect import bisect_left
+
+from typing import List, Dict, Sequence, Tuple, Callable
 from random import random
 from statistics import mean
 
-from .const import StockRow
-from .env import TICKERS
+import numpy as np
+
+from .const import StockRow, date_ordinal
+from .configs import Bounds
+from .env import TICKERS, INDICATOR_CACHE_SIZE
 
 CHARTS_PATH = "charts"
 INDICES_PATH = "indices"
 
+# Binary copies of the chart CSVs, loaded as memory maps
+CACHE_PATH = f"{CHARTS_PATH}/.cache"
+# Indicators of the all-time charts, keyed by the content of the chart CSVs
+INDICATORS_PATH = f"{CACHE_PATH}/indicators"
+CHART_DTYPE = np.dtype(
+    [("date", "U10"), ("price", "f8"), ("close_price", "f8")]
+)
 
-def read_chart(
-    ticker: str, start: str, end: str, test_mode: bool = False
-) -> List[StockRow]:
-    ticker = ticker.upper()
-    if ticker not in TICKERS.keys():
-        raise Exception(f"'{ticker}' is not supported")
 
-    history: List[StockRow] = []
-    with open(f"{CHARTS_PATH}/{ticker}-GEN.csv", "r") as fd:
-        reader = csv.reader(fd)
-        hist = [(d, float(p), float(cp)) for d, p, cp in reader]
-
-        mean_flucs = mean(abs((cp - p) / p) for _, p, cp in hist)
-        for d, p, cp in hist:
-            p = (
-                (1 - (mean_flucs / 2) + random() * mean_flucs) * float(p)
-                if test_mode
-                else float(p)
-            )
-            cp = (
-                (1 - (mean_flucs / 2) + random() * mean_flucs) * float(cp)
-                if test_mode
-                else float(cp)
-            )
-
-            history.append(StockRow(d, p, cp))
+# (stat, digest) of the CSVs hashed by this process. The change time and
+# inode cannot be kept by copies or restores, unlike the modification time.
+_digests: Dict[str, Tuple[Tuple[int, ...], str]] = {}
+
+
+def _digest(path: str) -> str:
+    st = os.stat(path)
+    key = (st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
+    memo = _digests.get(path)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+
+    with open(path, "rb") as fd:
+        digest = hashlib.sha1(fd.read()).hexdigest()[:16]
+
+    _digests[path] = (key, digest)
+    return digest
+
+
+def load_chart_file(
+    path: str, parse: Callable[[str], List[Tuple[str, float, float]]]
+) -> np.ndarray:
+    """Chart in `path` as a (memory-mapped) structured array of CHART_DTYPE.
 
+    The CSV is parsed only when its binary copy under CACHE_PATH, keyed by
+    the content hash of the CSV, is missing (e.g., after fetch-charts.py
+    appends new data, or the CSV is replaced by a copy with an older mtime).
+    """
+    name = os.path.basename(path)
+    cache = f"{CACHE_PATH}/{name}-{_digest(path)}.npy"
+
+    try:
+        return np.load(cache, mmap_mode="r")
+    except (FileNotFoundError, ValueError):
+        pass
+
+    rows = np.array(parse(path), dtype=CHART_DTYPE)
+
+    # Write to a temporary file first, as other processes may be loading it
+    os.makedirs(CACHE_PATH, exist_ok=True)
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fd:
+        np.save(fd, rows)
+    os.replace(tmp, cache)
+
+    # Copies of the previous contents of the CSV are never hit again
+    for entry in os.scandir(CACHE_PATH):
+        if entry.path == cache or not entry.name.endswith(".npy"):
+            continue
+
+        if entry.name.startswith(f"{name}-") or entry.name == f"{name}.npy":
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    return np.load(cache, mmap_mode="r")
+
+
+def _parse_chart(path: str) -> List[Tuple[str, float, float]]:
+    with open(path, "r") as fd:
+        return [(d, float(p), float(cp)) for d, p, cp in csv.reader(fd)]
+
+
+def _parse_base_chart(path: str) -> List[Tuple[str, float, float]]:
+    with open(path, "r") as fd:
+        reader = list(csv.reader(fd))
+        return [(d, float(p), float(cp)) for d, p, _, _, cp, _ in reader[1:]]
+
+
+def date_range(
+    dates: Sequence[str], start: str, end: str, strict: bool = False
+) -> slice:
+    """Indices from the first date starting with `start` to the last date
+    starting with `end` (e.g., "2020", "2020-03" or "2020-03-02").
+
+    `dates` must be sorted, so that both ends are found by binary search.
+    An empty prefix, or one without any matching date unless `strict`,
+    selects from the beginning or up to the end respectively. With `strict`,
+    a prefix without matching date raises ValueError.
+    """
     sidx = 0
     if start != "":
-        matching = [d.startswith(start) for d, _, _ in history]
-        try:
-            sidx = matching.index(True)
-        except:
-            pass
+        i = bisect_left(dates, start)
+        if i < len(dates) and dates[i].startswith(start):
+            sidx = i
+        elif strict:
+            raise ValueError(f"no date starting with '{start}'")
 
-    eidx = len(history)
+    eidx = len(dates)
     if end != "":
-        matching = [d.startswith(end) for d, _, _ in history]
-        try:
-            eidx = len(matching) - list(reversed(matching)).index(True)
-        except:
-            pass
+        # "\uffff" sorts after every character of a date
+        i = bisect_left(dates, end + "\uffff")
+        if i > 0 and dates[i - 1].startswith(end):
+            eidx = i
+        elif strict:
+            raise ValueError(f"no date starting with '{end}'")
 
-    return history[sidx:eidx]
+    return slice(sidx, eidx)
 
 
-def read_base_chart(ticker: str, start: str, end: str) -> List[StockRow]:
+def read_chart_array(ticker: str, start: str = "", end: str = "") -> np.ndarray:
+    ticker = ticker.upper()
+    if ticker not in TICKERS.keys():
+        raise Exception(f"'{ticker}' is not supported")
+
+    hist = load_chart_file(f"{CHARTS_PATH}/{ticker}-GEN.csv", _parse_chart)
+
+    return hist[date_range(hist["date"], start, end)]
+
+
+def read_base_chart_array(
+    ticker: str, start: str = "", end: str = ""
+) -> np.ndarray:
     ticker = ticker.upper()
     if ticker not in TICKERS.values():
         raise Exception(f"'{ticker}' is not supported")
 
-    with open(f"{CHARTS_PATH}/{ticker}.csv", "r") as fd:
-        reader = list(csv.reader(fd))
-        history = [
-            StockRow(d, float(p), float(cp)) for d, p, _, _, cp, _ in reader[1:]
+    hist = load_chart_file(f"{CHARTS_PATH}/{ticker}.csv", _parse_base_chart)
+
+    return hist[date_range(hist["date"], start, end)]
+
+
+def read_chart(
+    ticker: str, start: str, end: str, test_mode: bool = False
+) -> List[StockRow]:
+    if not test_mode:
+        return [
+            StockRow(d, p, cp)
+            for d, p, cp in read_chart_array(ticker, start, end).tolist()
         ]
 
-    sidx = 0
-    if start != "":
-        matching = [d.startswith(start) for d, _, _ in history]
-        try:
-            sidx = matching.index(True)
-        except:
-            pass
+    # Noise is scaled by the fluctuations of the all-time chart
+    hist = read_chart_array(ticker)
+    span = date_range(hist["date"], start, end)
+    hist = hist.tolist()
 
-    eidx = len(history)
-    if end != "":
-        matching = [d.startswith(end) for d, _, _ in history]
-        try:
-            eidx = len(matching) - list(reversed(matching)).index(True)
-        except:
-            pass
+    history: List[StockRow] = []
+    mean_flucs = mean(abs((cp - p) / p) for _, p, cp in hist)
+    for d, p, cp in hist:
+        p = (1 - (mean_flucs / 2) + random() * mean_flucs) * p
+        cp = (1 - (mean_flucs / 2) + random() * mean_flucs) * cp
+
+        history.append(StockRow(d, p, cp))
+
+    return history[span]
+
+
+def read_base_chart(ticker: str, start: str, end: str) -> List[StockRow]:
+    return [
+        StockRow(d, p, cp)
+        for d, p, cp in read_base_chart_array(ticker, start, end).tolist()
+    ]
+
+
+class Calendar:
+    """Trading dates of a chart, mapped to integer indices once.
+
+    Indicators, base charts and monthly series are aligned to the calendar
+    as arrays, so that simulations only deal with integer offsets.
+    """
+
+    def __init__(self, chart: List[StockRow]):
+        self.dates: List[str] = [c.date for c in chart]
+        self.index: Dict[str, int] = {d: i for i, d in enumerate(self.dates)}
+        self.ordinals: np.ndarray = np.array(
+            [date_ordinal(d) for d in self.dates], dtype=np.int64
+        )
+
+    def __len__(self):
+        return len(self.dates)
+
+    def span(self, chart: List[StockRow]) -> slice:
+        """Indices of a contiguous sub-chart in the calendar."""
+        return slice(self.index[chart[0].date], self.index[chart[-1].date] + 1)
+
+    def align(self, values: Dict[str, float]) -> np.ndarray:
+        """Values of a date-keyed dict for each date (NaN where missing)."""
+        aligned = np.full(len(self), np.nan)
+        for i, d in enumerate(self.dates):
+            try:
+                aligned[i] = values[d]
+            except KeyError:
+                pass
 
-    return history[sidx:eidx]
+        return aligned
+
+    def align_chart(self, chart: List[StockRow]) -> np.ndarray:
+        """Close prices of another chart for each date (NaN where missing)."""
+        closes = np.full(len(self), np.nan)
+        for c in chart:
+            i = self.index.get(c.date)
+            if i is not None:
+                closes[i] = c.close_price
+
+        return closes
 
 
 def read_sahm() -> Dict[str, float]:
@@ -99,84 +236,238 @@ def read_sahm() -> Dict[str, float]:
     return sahm
 
 
-def compute_rsi(chart: List[StockRow], term: int) -> Dict[str, float]:
-    rsis = {}
+def rolling_sums(values: np.ndarray, terms: Sequence[int]) -> np.ndarray:
+    """Sum of the last `term` values at every index, one row per term.
+
+    Fewer values are summed at the beginning. Integers are summed by the
+    differences of one cumulative sum, which are exact, in O(n) per term.
+    Floats are summed from the oldest value of each window on, vectorized
+    over all the windows, so that the sums are bit-identical to summing
+    every window with `sum` (differences of one cumulative sum are not, and
+    values of RSI or volatility lying on a config threshold would cross
+    it). The cost is O(n * term) for them.
+    """
+    n = len(values)
+    if np.issubdtype(values.dtype, np.integer):
+        csum = np.concatenate(([0], np.cumsum(values)))
+        idx = np.arange(1, n + 1)
+        starts = np.maximum(idx - np.asarray(terms)[:, None], 0)
+
+        return csum[idx] - csum[starts]
+
+    sums = np.zeros((len(terms), n), dtype=values.dtype)
+    for k, t in enumerate(terms):
+        for lag in range(min(t, n) - 1, -1, -1):
+            sums[k, lag:] += values[: n - lag]
+
+    return sums
 
-    def compute(ps: List[float]) -> float:
-        if len(ps) <= term:
-            return 50
 
-        diffs = [n - p for p, n in zip(ps[:-1], ps[1:])]
+def _rolling_changes(
+    closes: np.ndarray, terms: Sequence[int]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # ups[k, i] and tots[k, i] are the sums of positive and absolute changes
+    # over the last terms[k] days up to day i (aligned to closes)
+    diffs = np.diff(closes, prepend=closes[:1])
+    ups = rolling_sums(np.where(diffs > 0, diffs, 0.0), terms)
+    tots = rolling_sums(np.abs(diffs), terms)
 
-        tot_change = sum([d if d > 0 else -d for d in diffs])
-        upgoing = sum([d for d in diffs if d > 0])
+    return diffs, ups, tots
 
-        return 100 * upgoing / tot_change if tot_change > 0 else 50
 
-    prices = []
-    for date, _, cp in chart:
-        prices += [cp]
-        if len(prices) > term + 1:
-            prices.pop(0)
+def rolling_rsi(closes: np.ndarray, terms: Sequence[int]) -> np.ndarray:
+    _, ups, tot = _rolling_changes(closes, terms)
 
-        rsis[date] = compute(prices)
+    rsis = np.full(tot.shape, 50.0)
+    np.divide(100 * ups, tot, out=rsis, where=tot > 0)
+    for k, t in enumerate(terms):
+        rsis[k, :t] = 50
 
     return rsis
 
 
-def compute_volatility(chart: List[StockRow], term: int) -> Dict[str, float]:
-    volatility = {}
+def rolling_volatility(closes: np.ndarray, terms: Sequence[int]) -> np.ndarray:
+    diffs, _, tot = _rolling_changes(closes, terms)
 
-    def compute(ps: List[float]):
-        if len(ps) <= term:
-            return 0
+    volatility = np.zeros(tot.shape)
+    np.divide(100 * diffs, tot, out=volatility, where=tot > 0)
+    for k, t in enumerate(terms):
+        volatility[k, :t] = 0
 
-        diffs = [n - p for p, n in zip(ps[:-1], ps[1:])]
+    return volatility
 
-        tot_change = sum([abs(d) for d in diffs])
-        last_change = diffs[-1]
 
-        return 100 * last_change / tot_change
+def rolling_average(closes: np.ndarray, terms: Sequence[int]) -> np.ndarray:
+    counts = np.arange(1, len(closes) + 1)
 
-    prices = []
-    for date, _, cp in chart:
-        prices += [cp]
-        if len(prices) > term + 1:
-            prices.pop(0)
+    return np.stack(
+        [
+            sums / np.minimum(counts, t)
+            for sums, t in zip(rolling_sums(closes, terms), terms)
+        ]
+    )
 
-        volatility[date] = compute(prices)
 
-    return volatility
+def rolling_urates(
+    closes: np.ndarray, avg: int, terms: Sequence[int]
+) -> np.ndarray:
+    # Days under the average are counted in one cumulative pass for all
+    # `terms`
+    under = (closes < rolling_average(closes, [avg])[0]).astype(np.int64)
+    counts = np.arange(1, len(closes) + 1)
+
+    return rolling_sums(under, terms) / np.minimum(
+        counts, np.asarray(terms)[:, None]
+    )
+
+
+def _closes(chart: List[StockRow]) -> np.ndarray:
+    return np.array([c.close_price for c in chart], dtype=np.float64)
+
+
+def compute_rsi(chart: List[StockRow], term: int) -> Dict[str, float]:
+    rsis = rolling_rsi(_closes(chart), [term])[0]
+
+    return dict(zip((c.date for c in chart), rsis.tolist()))
+
+
+def compute_volatility(chart: List[StockRow], term: int) -> Dict[str, float]:
+    volatility = rolling_volatility(_closes(chart), [term])[0]
+
+    return dict(zip((c.date for c in chart), volatility.tolist()))
 
 
 def compute_moving_average(
     chart: List[StockRow], term: int
 ) -> Dict[str, float]:
-    avg_history = {}
+    avg_history = rolling_average(_closes(chart), [term])[0]
 
-    prices = []
-    for date, p, cp in chart:
-        prices += [cp]
-        if len(prices) > term:
-            prices.pop(0)
-
-        avg_history[date] = sum(prices) / len(prices) if prices else p
-
-    return avg_history
+    return dict(zip((c.date for c in chart), avg_history.tolist()))
 
 
 def compute_urates(
     chart: List[StockRow], avg: int, term: int
 ) -> Dict[str, float]:
-    avg_history = compute_moving_average(chart, avg)
-    u_rates = {}
+    u_rates = rolling_urates(_closes(chart), avg, [term])[0]
+
+    return dict(zip((c.date for c in chart), u_rates.tolist()))
+
+
+# Indicators of the all-time closes, computed by their name and parameters
+INDICATORS: Dict[str, Callable[..., np.ndarray]] = {
+    "urates": lambda closes, avg, term: rolling_urates(closes, avg, [term])[0],
+    "urate_terms": lambda closes, avg, first, last: rolling_urates(
+        closes, avg, range(first, last + 1)
+    ),
+    "rsis": lambda closes, term: rolling_rsi(closes, [term])[0],
+    "volatilities": lambda closes, term: rolling_volatility(closes, [term])[0],
+}
+
+
+def chart_version(ticker: str) -> str:
+    """Content hash of the chart and base chart CSVs of `ticker`, which
+    changes when fetch-charts.py appends new data."""
+    ticker = ticker.upper()
+    if ticker not in TICKERS.keys():
+        raise Exception(f"'{ticker}' is not supported")
+
+    return _digest(f"{CHARTS_PATH}/{ticker}-GEN.csv") + _digest(
+        f"{CHARTS_PATH}/{TICKERS[ticker]}.csv"
+    )
+
+
+def _evict(keep: str):
+    """Removes the least recently used indicators (by mtime, touched on
+    every hit) until the cache fits in INDICATOR_CACHE_SIZE megabytes."""
+    entries = []
+    for entry in os.scandir(INDICATORS_PATH):
+        if entry.name.endswith(".npy") and entry.path != keep:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime_ns, st.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries) + os.stat(keep).st_size
+    for _, size, path in sorted(entries):
+        if total <= INDICATOR_CACHE_SIZE * 1024 * 1024:
+            break
+
+        # Processes having it loaded keep their memory maps
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def read_indicator(ticker: str, name: str, *params: int) -> np.ndarray:
+    """Indicator `name` of the all-time chart of `ticker` (aligned to
+    `read_chart_array(ticker)`) as a memory-mapped array.
+
+    It is computed once and saved under INDICATORS_PATH, keyed by `params`
+    and the content hash of the chart CSV, so that it is recomputed when
+    fetch-charts.py appends new data.
+    """
+    ticker = ticker.upper()
+    if ticker not in TICKERS.keys():
+        raise Exception(f"'{ticker}' is not supported")
+
+    path = f"{CHARTS_PATH}/{ticker}-GEN.csv"
+    prefix = "-".join([ticker, name, *(str(p) for p in params)])
+    cache = f"{INDICATORS_PATH}/{prefix}-{_digest(path)}.npy"
+
+    try:
+        values = np.load(cache, mmap_mode="r")
+        os.utime(cache)
+        return values
+    except (FileNotFoundError, ValueError):
+        pass
+
+    closes = np.array(read_chart_array(ticker)["close_price"])
+    values = INDICATORS[name](closes, *params)
+
+    # Write to a temporary file first, as other processes may be loading it
+    os.makedirs(INDICATORS_PATH, exist_ok=True)
+    tmp = f"{cache}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as fd:
+        np.save(fd, values)
+    os.replace(tmp, cache)
+
+    # Entries of the previous contents of the CSV are never hit again
+    for entry in os.scandir(INDICATORS_PATH):
+        if entry.name.startswith(f"{prefix}-") and entry.path != cache:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    _evict(cache)
+
+    return np.load(cache, mmap_mode="r")
+
+
+class UrateTerms:
+    """U-rates of `ticker` for every term in `Bounds.term`, as a (term x day)
+    array computed from a single cumulative sum of the days under the
+    average (see `rolling_urates`), looked up by term.
+
+    Terms out of the bounds are read by `read_indicator` one by one.
+    """
+
+    def __init__(self, ticker: str, avg: int = 50):
+        self.ticker = ticker
+        self.avg = avg
+        self.first, self.last = Bounds().term
+        self.values = read_indicator(
+            ticker, "urate_terms", avg, self.first, self.last
+        )
 
-    u_counters = []
-    for c in chart:
-        u_counters.append(int(c.close_price < avg_history[c.date]))
-        if len(u_counters) > term:
-            u_counters.pop(0)
+    def __getitem__(self, term: int) -> np.ndarray:
+        if term < 1:
+            raise ValueError(f"invalid term: {term}")
 
-        u_rates[c.date] = sum(u_counters) / len(u_counters)
+        if self.first <= term <= self.last:
+            return self.values[term - self.first]
 
-    return u_rates
+        return read_indicator(self.ticker, "urates", self.avg, term)
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 from typing import List, Tuple, Dict, Any, Optional
 
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
 from .const import StockRow
 from .env import COMMISSION_RATE, SCALE_BY_PORTFOLIO
 
@@ -26,47 +29,58 @@ def compute_dca_rsi(full_chart: List[StockRow]) -> Dict[str, float]:
     Computes Welles Wilder RSI(14, 50) exactly matching the logic of price_history.dart:
     - Initial Up/Down is the average over the first 14 differences (or len(diffs) if fewer than 14).
     - Subsequent values are smoothed over the remaining diffs in the last 50 days window.
+
+    Until the window is full, it grows from the first difference, so the smoothing simply
+    continues from the previous day. Afterwards, a full window is always seeded with 14
+    differences and smoothed 36 times, which is a fixed linear filter over its 50 differences,
+    so all remaining days are computed at once (matches the windowed loop up to rounding).
     """
     prices = [c.close_price for c in full_chart]
     dates = [c.date for c in full_chart]
-    
+
     term = 14
     range_val = 50
-    rsi_dict = {}
-    
+    n = len(prices)
+    rsis = np.full(n, 50.0)
+
     # Pre-calculate differences
-    diffs = [prices[i+1] - prices[i] for i in range(len(prices)-1)]
-    
-    for i in range(len(full_chart)):
-        date = dates[i]
-        if i < term:
-            rsi_dict[date] = 50.0
-            continue
-            
-        # Last 50 changes leading to today
-        start_diff_idx = max(i - range_val, 0)
-        d_slice = diffs[start_diff_idx:i]
-        
-        if len(d_slice) <= term:
-            t = len(d_slice)
-            initial_slice = d_slice
+    diffs = [prices[i + 1] - prices[i] for i in range(n - 1)]
+
+    # Growing window (term <= i <= range_val)
+    up = down = 0.0
+    for i in range(term, min(n, range_val + 1)):
+        if i == term:
+            up = sum(d for d in diffs[:term] if d > 0) / term
+            down = sum(-d for d in diffs[:term] if d < 0) / term
         else:
-            t = term
-            initial_slice = d_slice[:term]
-            
-        up = sum(d for d in initial_slice if d > 0) / term
-        down = sum(-d for d in initial_slice if d < 0) / term
-        
-        for d in d_slice[t:]:
+            d = diffs[i - 1]
             up = (up * 13 + (d if d > 0 else 0.0)) / 14
             down = (down * 13 + (-d if d < 0 else 0.0)) / 14
-            
-        if up + down == 0:
-            rsi_dict[date] = 50.0
-        else:
-            rsi_dict[date] = 100.0 * (up / (up + down))
-            
-    return rsi_dict
+
+        if up + down != 0:
+            rsis[i] = 100.0 * (up / (up + down))
+
+    # Full window (i > range_val): diffs[i - range_val : i]
+    if n > range_val + 1:
+        n_smooth = range_val - term
+        decay = 13 / 14
+        weights = np.array(
+            [decay**n_smooth / term] * term
+            + [decay ** (n_smooth - 1 - j) / 14 for j in range(n_smooth)]
+        )
+
+        diffs = np.array(diffs)
+        gains = sliding_window_view(np.where(diffs > 0, diffs, 0.0), range_val)
+        losses = sliding_window_view(np.where(diffs < 0, -diffs, 0.0), range_val)
+
+        ups = gains[1:] @ weights
+        downs = losses[1:] @ weights
+        tot = ups + downs
+
+        tail = rsis[range_val + 1 :]
+        np.divide(100.0 * ups, tot, out=tail, where=tot != 0)
+
+    return dict(zip(dates, rsis.tolist()))
 
 
 def run_dca_backtest(
@@ -30,12 +30,23 @@ CYCLE_DAYS: int = int(os.environ.get("CYCLE_DAYS", 60))
 SEED: int = int(os.environ.get("SEED", 1000000))
 MAX_CYCLES: int = int(os.environ.get("MAX_CYCLES", 2))
 
+# Simulate every WINDOW_STRIDE-th sliding window, or WINDOW_SAMPLES random
+# windows (if not 0), to estimate the score of `test`
+WINDOW_STRIDE: int = int(os.environ.get("WINDOW_STRIDE", 1))
+WINDOW_SAMPLES: int = int(os.environ.get("WINDOW_SAMPLES", 0))
+
 FAIL_PENALTY: int = int(os.environ.get("FAIL_PENALTY", 2))
 FAIL_LIMIT: float = float(os.environ.get("FAIL_LIMIT", 0.1))
 
 COMMISSION_RATE: float = float(os.environ.get("COMMISSION_RATE", 0))
 assert COMMISSION_RATE < 0.01, "commission rate cannot exceed 0.01"
 
+# Megabytes of indicators kept on disk, least recently used evicted first
+INDICATOR_CACHE_SIZE: int = int(os.environ.get("INDICATOR_CACHE_SIZE", 256))
+
+# Seconds between checkpoints of exhaustive.py
+CHECKPOINT_INTERVAL: float = float(os.environ.get("CHECKPOINT_INTERVAL", 60))
+
 GRAPH: bool = bool(int(os.environ.get("GRAPH", 0)))
 BOXX: bool = bool(int(os.environ.get("BOXX", 0)))
 
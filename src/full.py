@@ -1,65 +1,117 @@
 import os
 import sys
-from typing import List, Tuple, Dict, Optional
+from typing import List, Tuple, Optional, Iterator
 from datetime import datetime, timedelta
 
+import numpy as np
+
 from .configs import Config
 from .const import SeedExhausted, State, Status, History, StockRow
 from .data import (
+    Calendar,
     read_chart,
     read_base_chart,
-    compute_urates,
-    compute_rsi,
-    compute_volatility,
+    read_indicator,
+    UrateTerms,
+    rolling_urates,
+    rolling_rsi,
+    rolling_volatility,
 )
 from .sim import oneday
 from .env import DEBUG, VERBOSE, TICKERS, SEED, MAX_CYCLES, BOXX
 
 
-def full_backtest(
+def base_rors(base_closes: np.ndarray) -> Optional[np.ndarray]:
+    """RoRs of the base chart since its first price in `base_closes` (NaN
+    where the base chart has no row), or None if it has no price at all."""
+    if np.all(np.isnan(base_closes)):
+        return None
+
+    found = ~np.isnan(base_closes)
+    initial_base_price = base_closes[found][0]
+
+    # Missing days keep the last base price found (0 if none yet)
+    last = np.maximum.accumulate(
+        np.where(found, np.arange(len(base_closes)), -1)
+    )
+    base_prices = np.where(last >= 0, base_closes[last], 0)
+
+    return (base_prices / initial_base_price) - 1
+
+
+def iter_backtest(
     config: Config,
     chart: List[StockRow],
-    urates: Dict[str, float],
-    rsis: Dict[str, float],
-    volatilities: Dict[str, float],
+    urates: np.ndarray,
+    rsis: np.ndarray,
+    volatilities: np.ndarray,
     log_fd: Optional[int] = None,
-    base_chart: Optional[List[StockRow]] = [],
-) -> History:
-
-    s: State = State.init(SEED, MAX_CYCLES - 1)
-    s.complete()
-
-    initial_base_price = base_chart[0].close_price if base_chart else 0
-    base_price = {s.date: s.close_price for s in base_chart}
+    rors: Optional[np.ndarray] = None,
+    s: Optional[State] = None,
+) -> Iterator[State]:
+    """States of each day of `chart`, simulated as the iteration advances.
+
+    Indicators and `rors` (of the base chart) are aligned to `chart`.
+    Starting from `s`, the last state of the previous days, continues a
+    backtest split into pieces.
+
+    The same `State` (`s` if given) advances in place and is yielded every
+    day, so that it must be recorded (e.g., by `History.append`) or copied
+    before the iteration advances.
+    """
+    if s is None:
+        s = State.init(SEED, MAX_CYCLES - 1)
+        s.complete()
+
+    urates, rsis, volatilities = (
+        urates.tolist(),
+        rsis.tolist(),
+        volatilities.tolist(),
+    )
+    rors = rors.tolist() if rors is not None else None
 
-    history: List[State] = []
-    prev_base_price = 0
-    for c in chart:
+    for i, c in enumerate(chart):
         try:
-            s = oneday(c, s, config, rsis, volatilities, urates)
+            s = oneday(c, s, config, rsis[i], volatilities[i], urates[i])
         except SeedExhausted:
-            s = State.from_(s, c)
+            s.advance(c)
             s.complete()
 
-        if initial_base_price:
-            try:
-                s.base_ror = (base_price[s.date] / initial_base_price) - 1
-                prev_base_price = base_price[s.date]
-            except KeyError:
-                s.base_ror = (prev_base_price / initial_base_price) - 1
+        if rors:
+            s.base_ror = rors[i]
 
-        history.append(s)
+        yield s
 
         if log_fd:
             print(
                 str(s)
                 + " ||| "
-                + f"rsi={rsis[c.date]:>2.0f}, urate={urates[c.date] * 100:>2.0f}%, vol={volatilities[c.date]:.0f}",
+                + f"rsi={rsis[i]:>2.0f}, urate={urates[i] * 100:>2.0f}%, vol={volatilities[i]:.0f}",
                 file=log_fd,
             )
             if s.boxx_eval < 0:
                 print(f"[{s.date}] boxx exhuasted ({s.boxx_eval})", file=log_fd)
 
+
+def full_backtest(
+    config: Config,
+    chart: List[StockRow],
+    urates: np.ndarray,
+    rsis: np.ndarray,
+    volatilities: np.ndarray,
+    log_fd: Optional[int] = None,
+    base_closes: Optional[np.ndarray] = None,
+) -> History:
+    # Indicators and base_closes (NaN where the base chart has no row) are
+    # aligned to `chart`
+    rors = base_rors(base_closes) if base_closes is not None else None
+
+    history: History = History(capacity=len(chart))
+    for s in iter_backtest(
+        config, chart, urates, rsis, volatilities, log_fd, rors
+    ):
+        history.append(s)
+
     return history
 
 
@@ -84,31 +136,45 @@ def full(
     chart = read_chart(ticker, start, end, test_mode=test_mode)
     base_chart = read_base_chart(base_ticker, start, end)
 
-    URATE = compute_urates(full_chart, 50, config.term)
-    RSI = compute_rsi(full_chart, 5)
-    VOLATILITY = compute_volatility(full_chart, 5)
+    calendar = Calendar(full_chart)
+    closes = np.array([c.close_price for c in full_chart])
+    span = calendar.span(chart)
+
+    if test_mode:
+        # Noisy charts are different every time
+        URATE = rolling_urates(closes, 50, [config.term])[0]
+        RSI = rolling_rsi(closes, [5])[0]
+        VOLATILITY = rolling_volatility(closes, [5])[0]
+    else:
+        URATE = UrateTerms(ticker)[config.term]
+        RSI = read_indicator(ticker, "rsis", 5)
+        VOLATILITY = read_indicator(ticker, "volatilities", 5)
+
+    history = full_backtest(
+        config, chart, URATE[span], RSI[span], VOLATILITY[span], log_fd
+    )
 
-    history = full_backtest(config, chart, URATE, RSI, VOLATILITY, log_fd)
+    first, last = history[0], history[-1]
 
     n_days = (
-        datetime.strptime(history[-1].date, "%Y-%m-%d")
-        - datetime.strptime(history[0].date, "%Y-%m-%d")
+        datetime.strptime(last.date, "%Y-%m-%d")
+        - datetime.strptime(first.date, "%Y-%m-%d")
     ).days
-    avg_ir = (1 + history[-1].ror) ** (365 / n_days) - 1
+    avg_ir = (1 + last.ror) ** (365 / n_days) - 1
 
-    base_end = [c for c in base_chart if c.date == history[-1].date][0]
-    base_start = [c for c in base_chart if c.date == history[0].date][0]
+    base_end = [c for c in base_chart if c.date == last.date][0]
+    base_start = [c for c in base_chart if c.date == first.date][0]
 
     base_ror = (base_end.close_price / base_start.close_price) - 1
     base_avg_ir = (1 + base_ror) ** (365 / n_days) - 1
 
-    n_exhausted = len(
-        [s for s in history if s.status == Status.Exhausted and s.cycle != 0]
-    )
-    n_failed = len(
-        [s for s in history if s.status == Status.Exhausted and s.cycle == 0]
-    )
-    n_sold = len([s for s in history if s.status == Status.Sold])
+    status = history.column("status")
+    cycle = history.column("cycle")
+
+    exhausted = status == Status.Exhausted.value
+    n_exhausted = int(np.count_nonzero(exhausted & (cycle != 0)))
+    n_failed = int(np.count_nonzero(exhausted & (cycle == 0)))
+    n_sold = int(np.count_nonzero(status == Status.Sold.value))
     n_tot = n_exhausted + n_failed + n_sold
 
     exhaust_rate = n_exhausted / n_tot if n_tot else 0
@@ -118,10 +184,10 @@ def full(
         print(f"{ticker}: {config} | {avg_ir:.2f}")
     else:
         print(
-            f"[{ticker} ({base_ticker})] {history[0].date} ~ {history[-1].date}"
+            f"[{ticker} ({base_ticker})] {first.date} ~ {last.date}"
         )
         print(
-            f"\tFinal RoR: {history[-1].ror * 100:.1f}% ({avg_ir * 100:.1f}%)"
+            f"\tFinal RoR: {last.ror * 100:.1f}% ({avg_ir * 100:.1f}%)"
         )
         print(f"\tBase RoR: {base_ror * 100:.1f}% ({base_avg_ir * 100:.1f}%)")
         print(
@@ -130,8 +196,8 @@ def full(
 
         if BOXX:
             boxx_ror = (
-                history[-1].boxx_eval - history[-1].boxx_seed
-            ) / history[-1].principal
+                last.boxx_eval - last.boxx_seed
+            ) / last.principal
 
             print(f"\tBOXX Profit: {boxx_ror * 100:.1f}%")
 
@@ -2,6 +2,7 @@ import os
 import re
 import sys
 import matplotlib
+import numpy as np
 from typing import List, Tuple
 from enum import Enum
 
@@ -14,7 +15,7 @@ if not sys.stdout.isatty():
 
 import matplotlib.pyplot as plt
 
-from .const import Status, State
+from .const import Status, History
 from .data import read_chart
 
 
@@ -87,21 +88,19 @@ def plot_chart(ticker: str, start: str, end: str):
         plt.show()
 
 
-def plot_full(ticker: str, start: str, end: str, history: List[State]):
-    dates = [s.date for s in history]
-    exhausted = [
-        i
-        for i, s in enumerate(history)
-        if s.status == Status.Exhausted and s.cycle != 0
-    ]
-    failed = [
-        i
-        for i, s in enumerate(history)
-        if s.status == Status.Exhausted and s.cycle == 0
-    ]
-    sold = [i for i, s in enumerate(history) if s.status == Status.Sold]
+def plot_full(ticker: str, start: str, end: str, history: History):
+    dates = history.column("date").tolist()
+    status = history.column("status")
+    cycle = history.column("cycle")
+    close_prices = history.column("close_price")
 
-    ymax = max(s.close_price for s in history)
+    exhausted = np.flatnonzero(
+        (status == Status.Exhausted.value) & (cycle != 0)
+    )
+    failed = np.flatnonzero((status == Status.Exhausted.value) & (cycle == 0))
+    sold = np.flatnonzero(status == Status.Sold.value)
+
+    ymax = close_prices.max()
 
     try:
         fig = plt.figure(figsize=(20, 8))
@@ -111,8 +110,8 @@ def plot_full(ticker: str, start: str, end: str, history: List[State]):
     ax1 = fig.add_subplot(111)
     ax2 = ax1.twinx()
 
-    ax1.plot([s.close_price for s in history], color="black", label="price")
-    ax1.plot([s.avg_price for s in history], color="gray", label="avg_price")
+    ax1.plot(close_prices, color="black", label="price")
+    ax1.plot(history.column("avg_price"), color="gray", label="avg_price")
     for x in exhausted:
         ax1.axvline(x, 0, ymax, color="tomato")
     for x in failed:
@@ -120,7 +119,7 @@ def plot_full(ticker: str, start: str, end: str, history: List[State]):
     for x in sold:
         ax1.axvline(x, 0, ymax, color="green")
 
-    ax2.plot([s.ror for s in history], color="blue", label="ror")
+    ax2.plot(history.column("ror"), color="blue", label="ror")
 
     xticks, xticklabels = get_ticks(dates, granul=Granul.Month6)
     ax1.set_xticks(xticks)
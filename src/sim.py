@@ -1,5 +1,3 @@
-from typing import Dict
-
 from .configs import Config
 from .const import SeedExhausted, StockRow, State, Status
 
@@ -8,20 +6,18 @@ def oneday(
     c: StockRow,
     s: State,
     config: Config,
-    RSI: Dict[str, float],
-    VOLATILITY: Dict[str, float],
-    URATE: Dict[str, float],
+    rsi: float,
+    vol: float,
+    urate: float,
 ) -> State:
     margin = config.margin
-    rsi = RSI[c.date]
-    vol = VOLATILITY[c.date]
-    urate = URATE[c.date]
 
     daily_seed: float = s.seed / config.term
-    new_s = State.from_(s, c)
 
+    # `s` advances in place (callers record it if they keep the history),
+    # and is left untouched when SeedExhausted is raised
     if s.stock_qty > 0 and c.close_price > s.avg_price * (1 + margin):
-        new_s.sell(qty=s.stock_qty, sell_price=c.close_price, sold=True)
+        s.sell(qty=s.stock_qty, sell_price=c.close_price, sold=True)
 
     else:
         dqtyD = float(daily_seed / c.close_price)
@@ -49,24 +45,25 @@ def oneday(
         if s.remaining_seed < c.close_price:
             assert s.status != Status.Sold
 
-            if new_s.cycle_left():  # cycles left # TODO: consider RSI?
+            if s.cycle_left():  # cycles left # TODO: consider RSI?
                 rate = config.sell_base + (
                     config.sell_limit - config.sell_base
                 ) * (1 - urate)
 
                 sell_qty = int(s.stock_qty * rate)
-                new_s.sell(qty=sell_qty, sell_price=c.close_price)
+                s.sell(qty=sell_qty, sell_price=c.close_price)
 
             else:  # exhausted
-                new_s.sell(qty=s.stock_qty, sell_price=c.close_price)
+                s.sell(qty=s.stock_qty, sell_price=c.close_price)
 
         elif s.remaining_seed >= dqty * c.close_price:
-            new_s.buy(qty=dqty, buy_price=c.close_price)
+            s.buy(qty=dqty, buy_price=c.close_price)
 
         else:  # s.remaining_seed >= c.close_price
             dqty = int(s.remaining_seed / c.close_price)
-            new_s.buy(qty=dqty, buy_price=c.close_price)
+            s.buy(qty=dqty, buy_price=c.close_price)
 
-    new_s.complete()
+    s.advance(c)
+    s.complete()
 
-    return new_s
+    return s
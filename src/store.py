@@ -0,0 +1,121 @@
+import os
+import sqlite3
+
+from typing import List, Tuple, Optional
+from dataclasses import astuple, fields
+
+from .configs import Config
+
+STORE_FILE = "results.db"
+
+# Results of each ticker and period (START, END) are kept per config, so that
+# the same config tested twice (e.g., after resuming) is stored once
+_FIELDS = [field.name for field in fields(Config)]
+_TYPES = {int: "INTEGER", float: "REAL"}
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS results (
+    ticker TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    {", ".join(f"{field.name} {_TYPES[field.type]} NOT NULL" for field in fields(Config))},
+    score REAL NOT NULL,
+    ror REAL,
+    exhaust_rate REAL,
+    fail_rate REAL,
+    UNIQUE (ticker, period_start, period_end, {", ".join(_FIELDS)})
+);
+CREATE INDEX IF NOT EXISTS results_by_score
+    ON results (ticker, period_start, period_end, score DESC);
+CREATE TABLE IF NOT EXISTS periods (
+    ticker TEXT NOT NULL,
+    period_start TEXT NOT NULL,
+    period_end TEXT NOT NULL,
+    PRIMARY KEY (ticker, period_start, period_end)
+);
+"""
+
+
+class ResultStore:
+    """Scores of tested configs in `directory`/results.db (SQLite).
+
+    Results are buffered by `add` and written by `flush` in one transaction.
+    Several processes can write to the same store at once.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+
+        self.db = sqlite3.connect(f"{directory}/{STORE_FILE}", timeout=60)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(_SCHEMA)
+
+        self.pending: List[Tuple] = []
+
+    def add(
+        self,
+        ticker: str,
+        start: str,
+        end: str,
+        config: Config,
+        score: float,
+        ror: Optional[float] = None,
+        exhaust_rate: Optional[float] = None,
+        fail_rate: Optional[float] = None,
+    ):
+        self.pending.append(
+            (ticker, start, end, *astuple(config))
+            + (score, ror, exhaust_rate, fail_rate)
+        )
+
+    def flush(self):
+        if not self.pending:
+            return
+
+        columns = ["ticker", "period_start", "period_end", *_FIELDS]
+        columns += ["score", "ror", "exhaust_rate", "fail_rate"]
+
+        with self.db:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO periods VALUES (?, ?, ?)",
+                set(r[:3] for r in self.pending),
+            )
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' * len(columns))})",
+                self.pending,
+            )
+
+        self.pending = []
+
+    def periods(self, ticker: str) -> List[Tuple[str, str]]:
+        return self.db.execute(
+            "SELECT period_start, period_end FROM periods WHERE ticker = ? "
+            "ORDER BY period_start, period_end",
+            (ticker,),
+        ).fetchall()
+
+    def top(
+        self, ticker: str, start: str, end: str, k: int
+    ) -> List[Tuple[Config, float, float, float, float]]:
+        """(config, score, ror, exhaust_rate, fail_rate) of the `k` best
+        configs of a period, best first."""
+        rows = self.db.execute(
+            f"SELECT {', '.join(_FIELDS)}, score, ror, exhaust_rate, fail_rate "
+            "FROM results "
+            "WHERE ticker = ? AND period_start = ? AND period_end = ? "
+            "ORDER BY score DESC LIMIT ?",
+            (ticker, start, end, k),
+        ).fetchall()
+
+        n = len(_FIELDS)
+        return [(Config(*r[:n]), *r[n:]) for r in rows]
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,19 +1,26 @@
 import os
 import sys
 from statistics import mean
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Optional, Callable, Iterable, Iterator
+from multiprocessing import Pool
+from dataclasses import dataclass, astuple
 
-from .const import StockRow, State, Result, History
+import numpy as np
+
+from .const import StockRow, State, Result, History, date_ordinal
 from .data import (
+    CHART_DTYPE,
+    Calendar,
+    date_range,
     read_chart,
-    compute_urates,
-    compute_rsi,
-    compute_volatility,
+    read_indicator,
     read_sahm,
 )
 from .configs import Config
+from .arena import ArraySpec, SharedArena
 
 from .sim import oneday
+from .batch import ConfigBatch, Lanes, simulate_batch
 from .env import (
     MARKET_DAYS_PER_YEAR,
     DEBUG,
@@ -23,15 +30,16 @@ from .env import (
     MAX_CYCLES,
     FAIL_PENALTY,
     FAIL_LIMIT,
+    COMMISSION_RATE,
+    WINDOW_STRIDE,
+    WINDOW_SAMPLES,
 )
 
 NUM_SIMULATED = 0
 NUM_RETIRED = 0
 
 
-def compute_weighted_results(
-    results: Dict[int, List[Result]],
-) -> Dict[str, Tuple[float, Result]]:
+def _date_results(results: Dict[int, List[Result]]) -> Dict[str, Result]:
     date_results: Dict[str, Result] = {}
     for c in range(MAX_CYCLES - 1):
         for r in results[c]:
@@ -41,69 +49,413 @@ def compute_weighted_results(
     for r in results[MAX_CYCLES - 1]:
         date_results[r.start] = r
 
-    weighted_results: Dict[str, float] = {}
-    sorted_dates = sorted(list(date_results.keys()))
+    return date_results
+
+
+def _weights(sorted_dates: List[str], ends: List[str]) -> np.ndarray:
+    """Weights of the starts in date order, each in [0, 1].
+
+    Start i is weighted by the share of the last CYCLE_DAYS starts d whose
+    chain of windows (d, the start at the end of d, and so on) first gets
+    to or past start i - 1 at start i - 1, i or i + 1 (see
+    `_weight_bounds`).
+    """
+    n = len(sorted_dates)
     date_idx = {d: i for i, d in enumerate(sorted_dates)}
 
-    for i, start in enumerate(sorted_dates):
-        last_cycle_dates = sorted_dates[max(i - CYCLE_DAYS, 0) : i]
+    # Start at the end of each window (-1 if none)
+    nexts = np.array([date_idx.get(e, -1) for e in ends], dtype=np.int64)
 
-        end_in_start: Dict[str, int] = {}
-        for d in reversed(last_cycle_dates):
-            res = date_results[d]
+    weights, _ = _weight_bounds(
+        nexts,
+        np.full(n, -1, dtype=np.int64),
+        np.zeros(n, dtype=np.int64),
+        np.full(n, n - 1, dtype=np.int64),
+    )
 
-            e = date_idx.get(res.end, sys.maxsize)
-            s = date_idx.get(start)
+    return weights
 
-            end_in_start[d] = int(abs(e - s) <= 1) or end_in_start.get(
-                res.end, 0
-            )
 
-        weight = (
-            sum(end_in_start.values()) / len(end_in_start)
-            if end_in_start
-            else 0.5
-        )
+def _weight_bounds(
+    nexts: np.ndarray,
+    open_from: np.ndarray,
+    firsts: np.ndarray,
+    lasts: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Lower and upper bounds of the weights of starts, whose windows end at
+    the starts `nexts` (-1 if none), in blocks of starts in date order from
+    `firsts` to `lasts` (e.g., one block per config).
 
-        weighted_results[start] = (weight, date_results[start])
+    Windows that have not ended yet (`open_from` >= 0, with `nexts` -1) end
+    at start `open_from` or later. Chains stop at them for the lower bounds,
+    and may get anywhere from there for the upper bounds. The bounds are
+    equal (the weights) if no window is open.
 
-    return weighted_results
+    Every chain is followed edge by edge for all starts at once, and each
+    edge (x, y) adds 1 to the starts i whose chain from d crosses i - 1 by
+    that edge.
+    """
+    n = len(nexts)
 
+    counts = np.zeros(n + 1, dtype=np.int64)
+    opened = np.zeros(n + 1, dtype=np.int64)
+    d = np.arange(n)
+    x = d.copy()
+    first = True
+    while len(d) > 0:
+        # The chain from d goes on past x only for the starts after x + 1
+        after = d + 1 if first else x + 2
+        limit = np.minimum(d + CYCLE_DAYS, lasts[d])
+
+        ends_open = open_from[x] >= 0
+        if np.any(ends_open):
+            lo = np.maximum(open_from[x] - 1, after)[ends_open]
+            hi = limit[ends_open]
+            crossed = lo <= hi
+            np.add.at(opened, lo[crossed], 1)
+            np.add.at(opened, hi[crossed] + 1, -1)
+
+        live = nexts[x] >= 0
+        d, x = d[live], x[live]
+        after, limit = after[live], limit[live]
+        y = nexts[x]
+
+        lo = np.maximum(y - 1, after)
+        hi = np.minimum(y + 1, limit)
+        crossed = lo <= hi
+        np.add.at(counts, lo[crossed], 1)
+        np.add.at(counts, hi[crossed] + 1, -1)
+
+        live = y + 2 <= d + CYCLE_DAYS
+        d, x = d[live], y[live]
+        first = False
+
+    n_last = np.minimum(np.arange(n) - firsts, CYCLE_DAYS)
+    counts = np.cumsum(counts[:n])
+    lower, upper = (
+        np.divide(c, n_last, out=np.full(n, 0.5), where=n_last > 0)
+        for c in (counts, counts + np.cumsum(opened[:n]))
+    )
+
+    return lower, upper
+
+
+def _min_fail_rates(
+    n_configs: int,
+    configs: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    sold: np.ndarray,
+    running: np.ndarray,
+) -> np.ndarray:
+    """Lower bounds of the fail rates of `n_configs` configs during the last
+    cycle.
+
+    Windows of each config are given by their start and end (indices of the
+    chart): those that have sold in any cycle or failed in the last one,
+    and those still `running` in the last cycle, which end at `ends` or
+    later and may yet sell. The failed windows weigh at least their lower
+    bounds, and the others at most their upper bounds (see
+    `_weight_bounds`).
+    """
+    order = np.lexsort((starts, configs))
+    configs, starts, ends = configs[order], starts[order], ends[order]
+    sold, running = sold[order], running[order]
+
+    # Starts of all configs in one sorted array, a block per config
+    stride = int(max(starts.max(initial=0), ends.max(initial=0))) + 1
+    keys = configs * stride + starts
+    firsts = np.searchsorted(keys, configs * stride)
+    lasts = np.searchsorted(keys, (configs + 1) * stride) - 1
+
+    # Start at the end of each window (-1 if none), or the first one that
+    # running windows may end at
+    targets = configs * stride + ends
+    found = np.searchsorted(keys, targets)
+    exact = keys[np.minimum(found, len(keys) - 1)] == targets
+    nexts = np.where(exact & ~running, found, -1)
+    open_from = np.where(running, found, -1)
+
+    lower, upper = _weight_bounds(nexts, open_from, firsts, lasts)
+
+    failed = ~sold & ~running
+    n_failed = np.bincount(
+        configs[failed], weights=lower[failed], minlength=n_configs
+    )
+    n_others = np.bincount(
+        configs[~failed], weights=upper[~failed], minlength=n_configs
+    )
+
+    n_total = n_failed + n_others
+    return np.divide(
+        n_failed, n_total, out=np.zeros(n_configs), where=n_total > 0
+    )
 
-def compute_fail_rate(results: Dict[int, List[Result]]) -> float:
-    weighted_results = compute_weighted_results(results)
 
-    n_failed = sum([w for w, r in weighted_results.values() if not r.sold])
-    n_total = sum([w for w, _ in weighted_results.values()])
+@dataclass
+class WeightedResults:
+    """Results of the starts in date order, and their weights."""
+
+    starts: List[str]
+    weights: np.ndarray
+    sold: np.ndarray
+    rors: np.ndarray
+    days: np.ndarray
+
+
+def _weighted(results: Dict[int, List[Result]]) -> WeightedResults:
+    date_results = _date_results(results)
+    starts = sorted(date_results.keys())
+    ordered = [date_results[d] for d in starts]
+
+    return WeightedResults(
+        starts,
+        _weights(starts, [r.end for r in ordered]),
+        np.array([r.sold for r in ordered], dtype=bool),
+        np.array([r.ror for r in ordered], dtype=np.float64),
+        np.array([r.days for r in ordered], dtype=np.float64),
+    )
+
+
+def compute_weighted_results(
+    results: Dict[int, List[Result]],
+) -> Dict[str, Tuple[float, Result]]:
+    date_results = _date_results(results)
+    weighted = _weighted(results)
+
+    return {
+        start: (weight, date_results[start])
+        for start, weight in zip(weighted.starts, weighted.weights.tolist())
+    }
+
+
+def _fail_rate(weighted: WeightedResults) -> float:
+    n_failed = float(weighted.weights[~weighted.sold].sum())
+    n_total = float(weighted.weights.sum())
 
     return n_failed / n_total
 
 
+def _avg_ror(weighted: WeightedResults) -> float:
+    tot_ror = float(np.dot(weighted.weights, weighted.rors))
+    tot_days = float(np.dot(weighted.weights, weighted.days))
+
+    return tot_ror / tot_days * MARKET_DAYS_PER_YEAR
+
+
+def compute_fail_rate(results: Dict[int, List[Result]]) -> float:
+    return _fail_rate(_weighted(results))
+
+
 def compute_avg_ror(results: Dict[int, List[Result]]):
-    weighted_results = compute_weighted_results(results)
+    return _avg_ror(_weighted(results))
 
-    tot_ror = 0
-    tot_days = 0
 
-    for s, wr in weighted_results.items():
-        weight, result = wr
+class TestContext:
+    """Chart of a ticker for a period, loaded once to test many configs.
 
-        tot_ror += weight * result.ror
-        tot_days += weight * result.days
+    Indicators of the all-time chart are read by `read_indicator`, kept by
+    the parameters they depend on and returned aligned to `chart`.
+    """
 
-    return tot_ror / tot_days * MARKET_DAYS_PER_YEAR
+    def __init__(self, ticker: str, start: str, end: str):
+        full_chart = read_chart(ticker, "", "")
+        calendar = Calendar(full_chart)
+        span = date_range(calendar.dates, start, end)
+
+        self._init(
+            ticker,
+            start,
+            end,
+            span,
+            full_chart[span],
+            calendar.align(read_sahm())[span],
+            {},
+        )
+
+    def _init(
+        self,
+        ticker: str,
+        start: str,
+        end: str,
+        span: slice,
+        chart: List[StockRow],
+        sahms: np.ndarray,
+        indicators: Dict[Tuple, np.ndarray],
+    ):
+        self.ticker = ticker
+        self.start = start
+        self.end = end
+
+        self.span: slice = span
+        self.chart: List[StockRow] = chart
+        self.sahms: np.ndarray = sahms
+
+        self._indicators = indicators
+
+    def arrays(self) -> Dict[Tuple, np.ndarray]:
+        """Arrays to rebuild the context with `_from_arrays` (e.g., from a
+        `SharedArena` in another process), including cached indicators."""
+        rows = np.array([astuple(c) for c in self.chart], dtype=CHART_DTYPE)
+
+        return {
+            ("chart",): rows,
+            ("sahms",): self.sahms,
+            **self._indicators,
+        }
+
+    @classmethod
+    def _from_arrays(
+        cls,
+        ticker: str,
+        start: str,
+        end: str,
+        span: slice,
+        arrays: Dict[Tuple, np.ndarray],
+    ) -> "TestContext":
+        arrays = dict(arrays)
+        chart = [StockRow(*r) for r in arrays.pop(("chart",)).tolist()]
+
+        context = cls.__new__(cls)
+        context._init(
+            ticker,
+            start,
+            end,
+            span,
+            chart,
+            arrays.pop(("sahms",)),
+            arrays,
+        )
+        return context
+
+    def _indicator(self, *key) -> np.ndarray:
+        if key not in self._indicators:
+            self._indicators[key] = read_indicator(self.ticker, *key)[self.span]
+
+        return self._indicators[key]
+
+    def urates(self, term: int = CYCLE_DAYS, avg: int = 50) -> np.ndarray:
+        return self._indicator("urates", avg, term)
+
+    def rsis(self, term: int = 5) -> np.ndarray:
+        return self._indicator("rsis", term)
+
+    def volatilities(self, term: int = 5) -> np.ndarray:
+        return self._indicator("volatilities", term)
+
+
+def compute_score(
+    results: Dict[int, List[Result]],
+) -> Tuple[float, float, float, float]:
+    exhaust_rate = len([r for r in results[0] if not r.sold]) / len(results[0])
+
+    # Weighted once for both
+    weighted = _weighted(results)
+    fail_rate = _fail_rate(weighted)
+    avg_ror_per_year = _avg_ror(weighted)
+
+    score = _penalized_score(avg_ror_per_year, fail_rate)
+
+    return score, avg_ror_per_year, exhaust_rate, fail_rate
+
+
+def _penalized_score(avg_ror_per_year: float, fail_rate: float) -> float:
+    return (
+        (1 - FAIL_PENALTY * fail_rate) * avg_ror_per_year * 100
+        if fail_rate < FAIL_LIMIT
+        else 0
+    )
+
+
+def _max_ratios(
+    closes: np.ndarray,
+    ordinals: np.ndarray,
+    starts: np.ndarray,
+    lanes: Lanes,
+) -> np.ndarray:
+    """Upper bounds of ror / days of the windows from `starts` that are
+    continued from `lanes` in the next cycles (`closes` and date `ordinals`
+    of the chart).
+
+    A day can raise the equity (the remaining seed and the stock at the
+    close price) by at most the rise of the close price, on the stock held,
+    which costs no more than the equity (up to the commission of the last
+    buy). Windows end no earlier than the day they continue from.
+    """
+    # Sum of the log rises of the close price up to each day
+    rises = np.concatenate(
+        [[0.0], np.cumsum(np.log(np.maximum(closes[1:] / closes[:-1], 1)))]
+    )
+
+    now = starts + np.maximum(lanes.day, 1) - 1
+    last = np.minimum(starts + MAX_CYCLES * CYCLE_DAYS - 1, len(closes) - 1)
+    growth = np.exp(rises[last] - rises[now])
+
+    equity = lanes.remaining + lanes.qty * closes[now]
+    slack = 1 - COMMISSION_RATE * (growth - 1)
+    max_equity = np.divide(
+        equity * growth,
+        slack,
+        out=np.full(len(starts), np.inf),
+        where=(slack > 0) & (lanes.remaining >= 0),
+    )
+
+    min_days = ordinals[starts + lanes.day] - ordinals[starts]
+    return np.divide(
+        max_equity / SEED - 1,
+        min_days,
+        out=np.full(len(starts), np.inf),
+        where=min_days > 0,
+    )
+
+
+def report_score(
+    ticker: str,
+    config: Config,
+    score: float,
+    avg_ror_per_year: float,
+    exhaust_rate: float,
+    fail_rate: float,
+):
+    print(
+        f"{ticker}: {config} | {score:.2f} ({avg_ror_per_year * 100:.1f}%, {exhaust_rate * 100:.1f}%, {fail_rate * 100:.1f}%)"
+    )
+
+
+def report_intervals(
+    ticker: str, config: Config, intervals: Dict[str, Tuple[float, float]]
+):
+    (s0, s1), (a0, a1), (f0, f1) = (
+        intervals["score"],
+        intervals["avg_ror_per_year"],
+        intervals["fail_rate"],
+    )
+    print(
+        f"{ticker}: {config} | range {s0:.2f} ~ {s1:.2f} ({a0 * 100:.1f}% ~ {a1 * 100:.1f}%, {f0 * 100:.1f}% ~ {f1 * 100:.1f}%)"
+    )
+
+
+def report_pruned(ticker: str, config: Config):
+    print(f"{ticker}: {config} | pruned")
 
 
 def simulate(
     chart: List[StockRow],
     max_cycle: int,
     config: Config,
-    URATE: Dict[str, float],
-    RSI: Dict[str, float],
-    VOLATILITY: Dict[str, float],
+    urates: np.ndarray,
+    rsis: np.ndarray,
+    volatilities: np.ndarray,
 ) -> History:
     global NUM_SIMULATED, NUM_RETIRED
 
+    # Indicators are aligned to `chart`
+    urates, rsis, volatilities = (
+        urates.tolist(),
+        rsis.tolist(),
+        volatilities.tolist(),
+    )
+
     if DEBUG:
         os.makedirs("logs/test", exist_ok=True)
         fd = open(f"logs/test/{chart[0].date}-{max_cycle}.log", "w")
@@ -113,16 +465,16 @@ def simulate(
     s: State = State.init(SEED, max_cycle)
     s.complete()
 
-    history: History = History()
-    for c in chart:
-        s = oneday(c, s, config, RSI, VOLATILITY, URATE)
+    history: History = History(capacity=len(chart))
+    for i, c in enumerate(chart):
+        s = oneday(c, s, config, rsis[i], volatilities[i], urates[i])
         history.append(s)
 
         if DEBUG or VERBOSE:
             print(
                 str(s)
                 + " ||| "
-                + f"rsi={RSI[c.date]:>2.0f}, urate={URATE[c.date] * 100:>2.0f}%, vol={VOLATILITY[c.date]:.0f}",
+                + f"rsi={rsis[i]:>2.0f}, urate={urates[i] * 100:>2.0f}%, vol={volatilities[i]:.0f}",
                 file=fd,
             )
 
@@ -147,85 +499,646 @@ def test(
     config: Config,
     start: str,
     end: str,
-) -> Tuple[Dict[int, List[Result]], Dict[int, List[History]], float]:
+    context: Optional[TestContext] = None,
+    stride: int = WINDOW_STRIDE,
+    samples: int = WINDOW_SAMPLES,
+) -> Tuple[
+    Dict[int, List[Result]],
+    Dict[int, List[History]],
+    float,
+    Optional[Dict[str, Tuple[float, float]]],
+]:
+    """Sliding window test of `config`.
+
+    Returns the results and histories (if DEBUG or VERBOSE) of the simulated
+    windows per cycle, the score, and error
+    ranges of the score if only every `stride`-th window or `samples`
+    random windows are simulated (see `compute_intervals`).
+    """
     global NUM_SIMULATED, NUM_RETIRED
     NUM_SIMULATED = 0
     NUM_RETIRED = 0
 
-    full_chart = read_chart(ticker, "", "")
-    chart = read_chart(ticker, start, end)
-
-    URATE = compute_urates(full_chart, 50, CYCLE_DAYS)
-    RSI = compute_rsi(full_chart, 5)
-    VOLATILITY = compute_volatility(full_chart, 5)
-    SAHM_INDICATOR = read_sahm()
+    context = context or TestContext(ticker, start, end)
+    chart, sahms = context.chart, context.sahms
+    urates, rsis, volatilities = (
+        context.urates(),
+        context.rsis(),
+        context.volatilities(),
+    )
 
-    # Split all-time chart to a number of fractions
-    charts = [chart[i : i + CYCLE_DAYS] for i in range(len(chart) - CYCLE_DAYS)]
+    starts = [
+        i
+        for i in range(len(chart) - CYCLE_DAYS)
+        if config.sahm_threshold == 0 or sahms[i] <= config.sahm_threshold
+    ]
 
-    _charts = charts
+    windows = np.array(starts, dtype=np.int64)
+    positions = _sample_windows(len(windows), stride, samples)
+    sampled = len(positions) < len(windows)
+    starts = windows[positions].tolist()
 
     histories: Dict[int, List[History]] = {}
     results: Dict[int, List[Result]] = {}
 
+    # Failed windows continue from where they stopped in the previous cycle
+    lanes: Optional[Lanes] = None
+
     for cycle in range(MAX_CYCLES):
         histories[cycle] = []
         results[cycle] = []
 
-        for chart in _charts:
-            if (
-                config.sahm_threshold != 0
-                and SAHM_INDICATOR[chart[0].date] > config.sahm_threshold
-            ):
-                continue
+        n_days = (cycle + 1) * CYCLE_DAYS
+
+        if DEBUG or VERBOSE:
+            for i in starts:
+                window = slice(i, i + n_days)
+                history = simulate(
+                    chart[window],
+                    cycle,
+                    config,
+                    urates[window],
+                    rsis[window],
+                    volatilities[window],
+                )
+
+                result = Result(
+                    start=history[0].date,
+                    end=history[-1].date,
+                    sold=history[-1].status.is_sold(),
+                    ror=history[-1].ror,
+                )
+
+                histories[cycle].append(history)
+                results[cycle].append(result)
+
+        else:
+            results[cycle], n_retired, lanes = simulate_batch(
+                chart,
+                starts,
+                n_days,
+                cycle,
+                config,
+                urates,
+                rsis,
+                volatilities,
+                SEED,
+                lanes,
+            )
 
-            history = simulate(chart, cycle, config, URATE, RSI, VOLATILITY)
+            NUM_SIMULATED += len(starts)
+            NUM_RETIRED += n_retired
 
-            result = Result(
-                start=history[0].date,
-                end=history[-1].date,
-                sold=history[-1].status.is_sold(),
-                ror=history[-1].ror,
+        # Extend the fractions that have failed by one more cycle,
+        # if the extended fraction fits in the chart
+        extend = [
+            k
+            for k, (i, res) in enumerate(zip(starts, results[cycle]))
+            if not res.sold and i + n_days < len(chart) - CYCLE_DAYS
+        ]
+        starts = [starts[k] for k in extend]
+        if lanes is not None:
+            lanes = lanes.take(np.array(extend, dtype=np.int64))
+
+    scored = results
+    if sampled:
+        index = {c.date: i for i, c in enumerate(chart)}
+        scored = _expand_results(results, chart, index, windows, positions)
+
+    row = compute_score(scored)
+    score = row[0]
+    report_score(ticker, config, *row)
+
+    intervals = None
+    if sampled:
+        intervals = compute_intervals(results, chart, index, windows, positions)
+        report_intervals(ticker, config, intervals)
+
+    if VERBOSE and NUM_RETIRED > 0.05 * NUM_SIMULATED:
+        print(
+            f"[warning] {NUM_RETIRED / NUM_SIMULATED * 100:.1f}% simulations retired"
+        )
+
+    sys.stdout.flush()
+    return results, histories, score, intervals
+
+
+def _sample_windows(n_windows: int, stride: int, samples: int) -> np.ndarray:
+    """Positions of the windows to simulate out of `n_windows` windows:
+    every `stride`-th, or `samples` windows at random (the same ones every
+    time)."""
+    if 0 < samples < n_windows:
+        rng = np.random.default_rng(0)
+        return np.sort(rng.choice(n_windows, samples, replace=False))
+
+    return np.arange(0, n_windows, max(stride, 1))
+
+
+def _expand_results(
+    results: Dict[int, List[Result]],
+    chart: List[StockRow],
+    index: Dict[str, int],
+    windows: np.ndarray,
+    positions: np.ndarray,
+) -> Dict[int, List[Result]]:
+    """Results of all `windows` (start indices) from those of the windows at
+    `positions`.
+
+    Each simulated window stands for the windows up to the next simulated
+    one, shifted by as many days, so that `compute_weighted_results` weights
+    them as if every window was simulated (a window is weighted by whether
+    the window of its end day ends at the start of another one).
+    """
+    bounds = np.append(positions, len(windows)).tolist()
+    units = {int(windows[p]): u for u, p in enumerate(positions.tolist())}
+
+    expanded: Dict[int, List[Result]] = {}
+    for cycle, cycle_results in results.items():
+        expanded[cycle] = []
+        for r in cycle_results:
+            s, e = index[r.start], index[r.end]
+            u = units[s]
+
+            for t in windows[bounds[u] : bounds[u + 1]].tolist():
+                expanded[cycle].append(
+                    Result(
+                        start=chart[t].date,
+                        end=chart[min(e + t - s, len(chart) - 1)].date,
+                        sold=r.sold,
+                        ror=r.ror,
+                    )
+                )
+
+    return expanded
+
+
+# Interleaved subsamples of the simulated windows to estimate the errors of
+# a sampled score, and the 97.5% quantile of Student's t for N_REPLICATES - 1
+# degrees of freedom
+N_REPLICATES = 4
+T_QUANTILE = 3.182
+
+
+def _sampled_estimate(
+    results: Dict[int, List[Result]],
+    chart: List[StockRow],
+    index: Dict[str, int],
+    windows: np.ndarray,
+    positions: np.ndarray,
+) -> np.ndarray:
+    """(avg_ror_per_year, fail_rate) of `results` of the windows at
+    `positions` only, corrected for the bias of sampling.
+
+    Copying each result to the windows in its gap (see `_expand_results`)
+    biases the weighting roughly in proportion to the gap - 1, so that the
+    estimate is extrapolated to a gap of 1 from the one of the halves of
+    `positions`, whose gap is twice as large.
+    """
+
+    def estimate(sub: np.ndarray) -> np.ndarray:
+        starts = {chart[i].date for i in windows[sub].tolist()}
+        sub_results = {
+            cycle: [r for r in cycle_results if r.start in starts]
+            for cycle, cycle_results in results.items()
+        }
+        expanded = _expand_results(sub_results, chart, index, windows, sub)
+        row = compute_score(expanded)
+        return np.array([row[1], row[3]])
+
+    gap = len(windows) / len(positions)
+    whole = estimate(positions)
+    halves = (estimate(positions[0::2]) + estimate(positions[1::2])) / 2
+
+    return whole - (halves - whole) * (gap - 1) / gap
+
+
+def compute_intervals(
+    results: Dict[int, List[Result]],
+    chart: List[StockRow],
+    index: Dict[str, int],
+    windows: np.ndarray,
+    positions: np.ndarray,
+) -> Dict[str, Tuple[float, float]]:
+    """Error ranges of the score, avg_ror_per_year and fail_rate of
+    `results` of the windows at `positions` only.
+
+    Every N_REPLICATES-th simulated window makes an interleaved subsample,
+    whose bias-corrected estimate is made the same way (see
+    `_sampled_estimate`). A range spans the estimate of `test` and the
+    bias-corrected one of all windows, widened by T_QUANTILE times the
+    standard error of the subsamples. The score ranges over the corners of
+    the avg_ror_per_year and fail_rate ranges.
+
+    These are not confidence intervals of a known level, since the bias is
+    only modelled. On 30 random configs of a 3000-day chart (4 offsets or
+    seeds each), the ranges contained the score of every window:
+
+        WINDOW_STRIDE=3       100% (score), 100% (ror), 93% (fail_rate)
+        WINDOW_STRIDE=8        98% (score),  98% (ror), 77% (fail_rate)
+        WINDOW_SAMPLES=1000    94% (score),  93% (ror), 63% (fail_rate)
+        WINDOW_SAMPLES=300     87% (score),  90% (ror), 32% (fail_rate)
+
+    Random windows leave uneven gaps, whose bias is larger and less
+    regular than the one of a stride, and the fail rate is mostly
+    underestimated, so that its range is too narrow.
+    """
+    if len(positions) < 2 * N_REPLICATES:
+        unbounded = (-np.inf, np.inf)
+        return {k: unbounded for k in ("score", "avg_ror_per_year", "fail_rate")}
+
+    expanded = _expand_results(results, chart, index, windows, positions)
+    row = compute_score(expanded)
+    estimate = np.array([row[1], row[3]])
+
+    corrected = _sampled_estimate(results, chart, index, windows, positions)
+    replicates = np.array(
+        [
+            _sampled_estimate(
+                results, chart, index, windows, positions[g::N_REPLICATES]
             )
+            for g in range(N_REPLICATES)
+        ]
+    )
 
-            histories[cycle].append(history)
-            results[cycle].append(result)
+    # (avg_ror_per_year, fail_rate) each
+    error = replicates.std(axis=0, ddof=1) / np.sqrt(N_REPLICATES)
+    (a0, f0) = np.minimum(estimate, corrected) - T_QUANTILE * error
+    (a1, f1) = np.maximum(estimate, corrected) + T_QUANTILE * error
 
-        # Rebuild fractions by extending the fractions that have failed
-        _charts = []
-        for res in results[cycle]:
-            if not res.sold:
-                idx = [c[0].date for c in charts].index(res.start)
+    scores = [_penalized_score(a, f) for a in (a0, a1) for f in (f0, f1)]
+    if f0 < FAIL_LIMIT <= f1:
+        scores.append(0)
 
-                # Check boundary condition
-                if idx + (cycle + 1) * CYCLE_DAYS >= len(charts):
-                    continue
+    return {
+        "score": (min(scores), max(scores)),
+        "avg_ror_per_year": (a0, a1),
+        "fail_rate": (f0, f1),
+    }
 
-                extended_chart = []
 
-                for i in range(cycle + 2):
-                    extended_chart += charts[idx + i * CYCLE_DAYS]
+# Days of the last cycle simulated by `test_batch` between the checks of
+# the configs against `best` (each check weighs every window, which costs
+# about as much as scoring the configs)
+BOUND_DAYS = 30
 
-                _charts.append(extended_chart)
 
-    exhaust_rate = len([r for r in results[0] if not r.sold]) / len(results[0])
-    fail_rate = compute_fail_rate(results)
-    avg_ror_per_year = compute_avg_ror(results)
+def test_batch(
+    ticker: str,
+    configs: List[Config],
+    start: str,
+    end: str,
+    context: Optional[TestContext] = None,
+    quiet: bool = False,
+    best: Optional[float] = None,
+    stride: int = 1,
+) -> List[Optional[Tuple[float, float, float, float]]]:
+    """Sliding window test of many configs in one pass over the chart.
 
-    score = (
-        (1 - FAIL_PENALTY * fail_rate) * avg_ror_per_year * 100
-        if fail_rate < FAIL_LIMIT
-        else 0
+    Every (config, window) pair becomes a lane of `simulate_batch`, so each
+    day's price and indicators are read once per batch. Prints the same line
+    as `test` per config (unless `quiet`) and returns (score,
+    avg_ror_per_year, exhaust_rate, fail_rate) rows in the order of
+    `configs`. Daily histories are not kept. With `best` (even -inf),
+    configs stop being simulated as soon as they provably score 0 or not
+    above `best`, and their rows are None. With `stride`, only every
+    `stride`-th window is simulated, as a cheaper estimate of the score.
+
+    Windows fail for good only in the last cycle, which is simulated
+    BOUND_DAYS days at a time with `best`. In between, windows that have
+    failed bound the fail rate from below (see `_min_fail_rates`), and
+    configs whose bound reaches FAIL_LIMIT are pruned. The average ror,
+    weighted by any weights, is at most the largest ror / days of the
+    windows that have ended and of those that continue (see `_max_ratios`),
+    which prunes configs by `best` after each cycle and step as well.
+    """
+
+    context = context or TestContext(ticker, start, end)
+    chart = context.chart
+    urates, rsis, volatilities = (
+        context.urates(),
+        context.rsis(),
+        context.volatilities(),
     )
+    sahms = context.sahms[: len(chart) - CYCLE_DAYS]
 
-    print(
-        f"{ticker}: {config} | {score:.2f} ({avg_ror_per_year * 100:.1f}%, {exhaust_rate * 100:.1f}%, {fail_rate * 100:.1f}%)"
+    batch = ConfigBatch._from(configs)
+    thresholds = batch.sahm_threshold[:, None]
+    windows = [
+        np.flatnonzero(valid)
+        for valid in (thresholds == 0) | (sahms[None, :] <= thresholds)
+    ]
+    positions = [_sample_windows(len(w), stride, 0) for w in windows]
+    lane_config = np.concatenate(
+        [np.full(len(p), k, dtype=np.int64) for k, p in enumerate(positions)]
     )
+    lane_start = np.concatenate([w[p] for w, p in zip(windows, positions)])
 
-    if VERBOSE and NUM_RETIRED > 0.05 * NUM_SIMULATED:
-        print(
-            f"[warning] {NUM_RETIRED / NUM_SIMULATED * 100:.1f}% simulations retired"
-        )
+    results: List[Dict[int, List[Result]]] = [
+        {cycle: [] for cycle in range(MAX_CYCLES)} for _ in configs
+    ]
+
+    # Failed lanes continue from where they stopped in the previous cycle
+    lanes: Optional[Lanes] = None
+
+    # Expanded windows (see `_expand_results`) may be shorter than theirs,
+    # and the score is bounded by the average ror only if
+    # 1 - FAIL_PENALTY * fail_rate cannot be negative
+    bounded = best is not None and stride == 1
+    ror_bounded = (
+        bounded and best > -np.inf and FAIL_PENALTY * FAIL_LIMIT <= 1
+    )
+    if bounded:
+        index = {c.date: i for i, c in enumerate(chart)}
+        closes = np.array([c.close_price for c in chart], dtype=np.float64)
+        ordinals = np.array([date_ordinal(c.date) for c in chart])
+        max_ratios = np.full(len(configs), -np.inf)
+
+        # Windows that have ended for good, as (config, start, end, sold)
+        ended: List[Tuple[np.ndarray, ...]] = []
+    pruned = np.zeros(len(configs), dtype=bool)
+
+    for cycle in range(MAX_CYCLES):
+        n_days = (cycle + 1) * CYCLE_DAYS
+        last = cycle == MAX_CYCLES - 1
+
+        # Windows fail for good in the last cycle only, which is simulated
+        # BOUND_DAYS days at a time to bound the fail rates in between
+        steps = [n_days]
+        if bounded and last:
+            steps = [
+                *range(cycle * CYCLE_DAYS + BOUND_DAYS, n_days, BOUND_DAYS),
+                n_days,
+            ]
+
+        for step in steps:
+            cycle_results, _, lanes = simulate_batch(
+                chart,
+                lane_start,
+                step,
+                cycle,
+                batch.take(lane_config),
+                urates,
+                rsis,
+                volatilities,
+                SEED,
+                lanes,
+            )
+
+            sold = np.array([res.sold for res in cycle_results], dtype=bool)
+
+            # Lanes of the last cycle that have neither sold nor got
+            # exhausted by `step`
+            running = ~sold & (lanes.day == step) & (step < n_days)
+            for k, res, r in zip(
+                lane_config.tolist(), cycle_results, running.tolist()
+            ):
+                if not r:
+                    results[k][cycle].append(res)
+
+            if last:
+                keep = running
+            else:
+                keep = ~sold & (lane_start + n_days < len(chart) - CYCLE_DAYS)
+
+            if bounded and step < MAX_CYCLES * CYCLE_DAYS:
+                # Windows that sold, or failed in the last cycle, are final
+                final = ~running if last else sold
+                ends = np.array(
+                    [index[res.end] for res in cycle_results], dtype=np.int64
+                )
+                ended.append(
+                    (
+                        lane_config[final],
+                        lane_start[final],
+                        ends[final],
+                        sold[final],
+                    )
+                )
+
+                rors = np.array([res.ror for res in cycle_results])
+                days = ordinals[ends[final]] - ordinals[lane_start[final]]
+                ratios = np.divide(
+                    rors[final],
+                    days,
+                    out=np.full(len(days), np.inf),
+                    where=days > 0,
+                )
+                np.maximum.at(max_ratios, lane_config[final], ratios)
+
+                # Configs that provably score 0
+                min_fails = np.zeros(len(configs))
+                if last:
+                    # Running lanes end on `step` or later
+                    w_config, w_start, w_end, w_sold = (
+                        np.concatenate(w)
+                        for w in zip(
+                            *ended,
+                            (
+                                lane_config[keep],
+                                lane_start[keep],
+                                lane_start[keep] + step,
+                                sold[keep],
+                            ),
+                        )
+                    )
+                    w_running = np.arange(len(w_config)) >= len(
+                        w_config
+                    ) - np.count_nonzero(keep)
+
+                    # Fail rates are bounded by 0 without failed windows
+                    failing = np.zeros(len(configs), dtype=bool)
+                    failing[w_config[~w_sold & ~w_running]] = True
+                    live = failing[w_config] & ~pruned[w_config]
+                    min_fails = _min_fail_rates(
+                        len(configs),
+                        w_config[live],
+                        w_start[live],
+                        w_end[live],
+                        w_sold[live],
+                        w_running[live],
+                    )
+
+                # With a margin for rounding
+                pruned |= min_fails >= FAIL_LIMIT * (1 + 1e-9)
+
+                # Configs that provably score not above `best`
+                if ror_bounded:
+                    max_scores = max_ratios.copy()
+                    np.maximum.at(
+                        max_scores,
+                        lane_config[keep],
+                        _max_ratios(
+                            closes,
+                            ordinals,
+                            lane_start[keep],
+                            lanes.take(keep),
+                        ),
+                    )
+                    max_scores = (
+                        (1 - FAIL_PENALTY * min_fails)
+                        * np.maximum(max_scores, 0)
+                        * MARKET_DAYS_PER_YEAR
+                        * 100
+                    )
+                    pruned |= max_scores * (1 + 1e-9) <= best
+
+                keep &= ~pruned[lane_config]
+
+            lane_config, lane_start = lane_config[keep], lane_start[keep]
+            lanes = lanes.take(keep)
+
+    if stride > 1:
+        index = {c.date: i for i, c in enumerate(chart)}
+        results = [
+            _expand_results(res, chart, index, windows[k], positions[k])
+            for k, res in enumerate(results)
+        ]
+
+    rows = []
+    for config, res, hopeless in zip(configs, results, pruned.tolist()):
+        row = None if hopeless else compute_score(res)
+        if quiet:
+            pass
+        elif row is None:
+            report_pruned(ticker, config)
+        else:
+            report_score(ticker, config, *row)
+
+        rows.append(row)
 
     sys.stdout.flush()
-    return results, histories, score
+    return rows
+
+
+# Context of the worker processes of `test_parallel`
+_WORKER_ARENA: Optional[SharedArena] = None
+_WORKER_CONTEXT: Optional[TestContext] = None
+
+
+def _attach_context(
+    ticker: str,
+    start: str,
+    end: str,
+    span: slice,
+    name: str,
+    specs: List[ArraySpec],
+):
+    global _WORKER_ARENA, _WORKER_CONTEXT
+
+    _WORKER_ARENA = SharedArena.attach(name, specs)
+    _WORKER_CONTEXT = TestContext._from_arrays(
+        ticker, start, end, span, _WORKER_ARENA.arrays
+    )
+
+
+def _test_chunk(
+    task: Tuple[List[Config], Optional[float], int],
+    context: Optional[TestContext] = None,
+) -> List[Tuple[Config, Optional[Tuple[float, float, float, float]]]]:
+    configs, best, stride = task
+    context = context or _WORKER_CONTEXT
+    rows = test_batch(
+        context.ticker,
+        configs,
+        context.start,
+        context.end,
+        context,
+        True,
+        best,
+        stride,
+    )
+
+    return list(zip(configs, rows))
+
+
+class TestPool:
+    """Processes running `test_batch` on chunks of configs of `context`.
+
+    The chart and indicators of `context` are placed in shared memory once
+    and attached by every worker when the pool is created, so that the pool
+    can `test` many batches (e.g., the generations of an optimizer) without
+    starting processes again. With `processes` <= 1, chunks are tested in
+    this process.
+    """
+
+    def __init__(self, context: TestContext, processes: int):
+        self.context = context
+        self.arena: Optional[SharedArena] = None
+        self.pool: Optional[Pool] = None
+
+        if processes <= 1:
+            return
+
+        # Indicators used by `test_batch` are computed once here
+        context.urates(), context.rsis(), context.volatilities()
+
+        self.arena = SharedArena.create(context.arrays())
+        initargs = (
+            context.ticker,
+            context.start,
+            context.end,
+            context.span,
+            self.arena.name,
+            self.arena.specs,
+        )
+        try:
+            self.pool = Pool(processes, _attach_context, initargs)
+        except:
+            self.arena.close()
+            raise
+
+    def test(
+        self,
+        chunks: Iterable[List[Config]],
+        best: Optional[Callable[[], float]] = None,
+        stride: int = 1,
+    ) -> Iterator[Tuple[Config, Optional[Tuple[float, float, float, float]]]]:
+        """`test_batch` of each chunk of configs.
+
+        Chunks are handed out one at a time, so that workers stay busy until
+        the last chunk. Yields (config, (score, avg_ror_per_year,
+        exhaust_rate, fail_rate)) in the order of `chunks`.
+
+        With `best`, configs are pruned against the value it returns when
+        their chunk is handed out (see `test_batch`), and only every
+        `stride`-th window is simulated.
+        """
+        tasks = (
+            (configs, best() if best else None, stride) for configs in chunks
+        )
+
+        if self.pool is None:
+            for task in tasks:
+                yield from _test_chunk(task, self.context)
+            return
+
+        for rows in self.pool.imap(_test_chunk, tasks):
+            yield from rows
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+        if self.arena is not None:
+            self.arena.close()
+            self.arena = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def test_parallel(
+    context: TestContext,
+    chunks: Iterable[List[Config]],
+    processes: int,
+    best: Optional[Callable[[], float]] = None,
+    stride: int = 1,
+) -> Iterator[Tuple[Config, Optional[Tuple[float, float, float, float]]]]:
+    """`TestPool.test` on a pool of `processes` for `chunks` only."""
+    with TestPool(context, processes) as pool:
+        yield from pool.test(chunks, best, stride)
@@ -1,54 +1,22 @@
-import os
-import re
+from typing import Optional
 
-from typing import Tuple
 
+def _percent(rate: Optional[float]) -> str:
+    return "-" if rate is None else f"{rate * 100:.1f}%"
 
-def analyze_result(directory: str, ticker: str):
-    files = [
-        f"{directory}/{f}"
-        for f in os.listdir(directory)
-        if f.startswith(ticker)
-    ]
 
-    from .configs import Config
+def analyze_result(directory: str, ticker: str, k: int = 2):
+    """Print the `k` best configs of each period tested for `ticker`."""
 
-    def parse_line(line: str) -> Tuple[Config, float]:
-        line = line.replace(f"{ticker}: ", "")
+    from .store import ResultStore
 
-        conf, res = line.split(" | ")
-        m = re.match(r"(.+?) \((.+)%?, (.+)%?\)\n", res)
-        score, ror_per_year, fail_rate = m.groups()
+    with ResultStore(directory) as store:
+        for start, end in store.periods(ticker):
+            print(f"[{start or '-'} ~ {end or '-'}]")
 
-        score = float(score)
-
-        conf = [c.split(": ") for c in conf.split(", ")]
-        conf = {k: float(v) for k, v in conf}
-
-        config = Config(**conf)
-
-        return ((config, (ror_per_year, fail_rate)), score)
-
-    final_results = {}
-    for f in files:
-        results = {}
-
-        with open(f, "r") as fd:
-            lines = fd.readlines()
-
-        for l in lines:
-            try:
-                config_and_result, score = parse_line(l)
-                results[config_and_result] = score
-            except Exception as e:
-                pass
-
-        sorted_results = sorted(results.items(), key=lambda item: item[1])
-
-        for s in sorted_results[-2:]:
-            final_results[s[0]] = s[1]
-
-    final_results = sorted(final_results.items(), key=lambda item: -item[1])
-
-    for cr, score in final_results:
-        print(f"{score} {cr[1]}: {cr[0]}")
+            for config, score, ror, _, fail_rate in store.top(
+                ticker, start, end, k
+            ):
+                print(
+                    f"{score:.2f} ({_percent(ror)}, {_percent(fail_rate)}): {config}"
+                )
@@ -0,0 +1,130 @@
+import math
+from datetime import date, timedelta
+from random import Random
+from typing import Dict, List
+
+import numpy as np
+import pytest
+
+import src.test as T
+from src.configs import Config
+from src.const import Result, StockRow
+from src.env import CYCLE_DAYS
+
+CONFIGS = [
+    Config(),
+    Config(
+        margin=0.05,
+        bullish_rsi=60,
+        burst_urate=0.8,
+        burst_scale=3.0,
+        burst_vol=25,
+        sell_base=0.5,
+        sell_limit=0.5,
+    ),
+    Config(margin=0.15, bullish_rsi=90, sell_base=0.1, sell_limit=0.9),
+    Config(term=20, margin=0.1, sahm_threshold=0.5),
+    Config(margin=0.08, burst_scale=1.0, sahm_threshold=1.0),
+]
+
+
+def make_context(n: int, seed: int = 0) -> T.TestContext:
+    # Trending and crashing prices, so that windows sell, get exhausted and
+    # fail cycles, with random indicators and sahm values
+    rng = Random(seed)
+    price = 50.0
+    rows = []
+    for i in range(n):
+        if i % 40 == 0:
+            drift = rng.choice([-0.015, -0.005, 0.0, 0.005, 0.01])
+        price = min(max(price * (1 + drift + rng.gauss(0, 0.03)), 1.0), 500.0)
+        day = (date(2000, 1, 3) + timedelta(days=i)).isoformat()
+        rows.append((day, price, price))
+
+    arrays = {
+        ("chart",): np.array(rows, dtype=T.CHART_DTYPE),
+        ("sahms",): np.array([rng.uniform(0, 1.5) for _ in range(n)]),
+        ("urates", 50, CYCLE_DAYS): np.array([rng.random() for _ in range(n)]),
+        ("rsis", 5): np.array([rng.uniform(0, 100) for _ in range(n)]),
+        ("volatilities", 5): np.array([rng.gauss(0, 40) for _ in range(n)]),
+    }
+
+    return T.TestContext._from_arrays("TEST", "", "", slice(0, n), arrays)
+
+
+def reference_results(
+    context: T.TestContext, config: Config, max_cycles: int
+) -> Dict[int, List[Result]]:
+    # `sim.oneday` day by day, restarting every window of each cycle from
+    # its first day (as `test` did before `simulate_batch`)
+    chart = context.chart
+    urates, rsis, volatilities = (
+        context.urates(),
+        context.rsis(),
+        context.volatilities(),
+    )
+    starts = [
+        i
+        for i in range(len(chart) - CYCLE_DAYS)
+        if config.sahm_threshold == 0
+        or context.sahms[i] <= config.sahm_threshold
+    ]
+
+    results: Dict[int, List[Result]] = {}
+    for cycle in range(max_cycles):
+        n_days = (cycle + 1) * CYCLE_DAYS
+
+        results[cycle] = []
+        for i in starts:
+            window = slice(i, i + n_days)
+            history = T.simulate(
+                chart[window],
+                cycle,
+                config,
+                urates[window],
+                rsis[window],
+                volatilities[window],
+            )
+            results[cycle].append(
+                Result(
+                    start=history[0].date,
+                    end=history[-1].date,
+                    sold=history[-1].status.is_sold(),
+                    ror=history[-1].ror,
+                )
+            )
+
+        starts = [
+            i
+            for i, res in zip(starts, results[cycle])
+            if not res.sold and i + n_days < len(chart) - CYCLE_DAYS
+        ]
+
+    return results
+
+
+@pytest.mark.parametrize("max_cycles", [2, 3])
+def test_simulate_batch(monkeypatch, max_cycles: int):
+    monkeypatch.setattr(T, "MAX_CYCLES", max_cycles)
+    context = make_context(400)
+
+    references = [
+        reference_results(context, config, max_cycles) for config in CONFIGS
+    ]
+
+    # Some windows of every config must be continued to the last cycle
+    for reference in references:
+        assert len(reference[max_cycles - 1]) > 0
+
+    for config, reference in zip(CONFIGS, references):
+        results, _, _, _ = T.test("TEST", config, "", "", context, 1, 0)
+        assert results == reference
+
+    rows = T.test_batch("TEST", CONFIGS, "", "", context, True)
+    assert rows == [T.compute_score(reference) for reference in references]
+
+    # Configs are aborted only if they score 0
+    rows = T.test_batch("TEST", CONFIGS, "", "", context, True, -math.inf)
+    for row, reference in zip(rows, references):
+        score = T.compute_score(reference)
+        assert row == score or (row is None and score[0] == 0)
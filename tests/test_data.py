@@ -0,0 +1,143 @@
+from random import Random
+from typing import Dict, List
+
+import pytest
+
+from src.const import StockRow
+from src.data import (
+    compute_rsi,
+    compute_volatility,
+    compute_moving_average,
+    compute_urates,
+)
+
+
+def make_chart(n: int, seed: int = 0) -> List[StockRow]:
+    # Prices in cents moving by a few cents a day, so that RSI and
+    # volatility often lie exactly on multiples of 5
+    rng = Random(seed)
+    cents = 1000
+    chart = []
+    for i in range(n):
+        cents = max(cents + rng.choice([-3, -2, -1, 1, 2, 3]), 1)
+        chart.append(StockRow(f"d{i:05d}", cents / 100, cents / 100))
+
+    return chart
+
+
+# Per-day windowed loops the rolling kernels replaced
+
+
+def reference_rsi(chart: List[StockRow], term: int) -> Dict[str, float]:
+    rsis = {}
+
+    def compute(ps: List[float]) -> float:
+        if len(ps) <= term:
+            return 50
+
+        diffs = [n - p for p, n in zip(ps[:-1], ps[1:])]
+
+        tot_change = sum([d if d > 0 else -d for d in diffs])
+        upgoing = sum([d for d in diffs if d > 0])
+
+        return 100 * upgoing / tot_change if tot_change > 0 else 50
+
+    prices = []
+    for date, _, cp in chart:
+        prices += [cp]
+        if len(prices) > term + 1:
+            prices.pop(0)
+
+        rsis[date] = compute(prices)
+
+    return rsis
+
+
+def reference_volatility(
+    chart: List[StockRow], term: int
+) -> Dict[str, float]:
+    volatility = {}
+
+    def compute(ps: List[float]):
+        if len(ps) <= term:
+            return 0
+
+        diffs = [n - p for p, n in zip(ps[:-1], ps[1:])]
+
+        tot_change = sum([abs(d) for d in diffs])
+        last_change = diffs[-1]
+
+        # The loop raised ZeroDivisionError on flat windows
+        return 100 * last_change / tot_change if tot_change > 0 else 0
+
+    prices = []
+    for date, _, cp in chart:
+        prices += [cp]
+        if len(prices) > term + 1:
+            prices.pop(0)
+
+        volatility[date] = compute(prices)
+
+    return volatility
+
+
+def reference_moving_average(
+    chart: List[StockRow], term: int
+) -> Dict[str, float]:
+    avg_history = {}
+
+    prices = []
+    for date, p, cp in chart:
+        prices += [cp]
+        if len(prices) > term:
+            prices.pop(0)
+
+        avg_history[date] = sum(prices) / len(prices) if prices else p
+
+    return avg_history
+
+
+def reference_urates(
+    chart: List[StockRow], avg: int, term: int
+) -> Dict[str, float]:
+    avg_history = reference_moving_average(chart, avg)
+    u_rates = {}
+
+    u_counters = []
+    for c in chart:
+        u_counters.append(int(c.close_price < avg_history[c.date]))
+        if len(u_counters) > term:
+            u_counters.pop(0)
+
+        u_rates[c.date] = sum(u_counters) / len(u_counters)
+
+    return u_rates
+
+
+@pytest.mark.parametrize("n", [1, 5, 6, 50, 2000])
+@pytest.mark.parametrize("term", [5, 14])
+def test_rsi_and_volatility_are_exact(n, term):
+    chart = make_chart(n)
+
+    assert compute_rsi(chart, term) == reference_rsi(chart, term)
+    assert compute_volatility(chart, term) == reference_volatility(chart, term)
+
+
+@pytest.mark.parametrize("n", [1, 49, 50, 51, 2000])
+def test_moving_average_and_urates_are_exact(n):
+    chart = make_chart(n, seed=1)
+
+    assert compute_moving_average(chart, 50) == reference_moving_average(
+        chart, 50
+    )
+    for term in (40, 60):
+        assert compute_urates(chart, 50, term) == reference_urates(
+            chart, 50, term
+        )
+
+
+def test_thresholds_are_hit():
+    # Otherwise the exactness above would not matter
+    rsis = compute_rsi(make_chart(2000), 5).values()
+
+    assert sum(r % 5 == 0 and r not in (0, 50, 100) for r in rsis) > 100
@@ -0,0 +1,89 @@
+from random import Random
+from typing import Dict, List
+
+import pytest
+
+from src.const import StockRow
+from src.dca import compute_dca_rsi
+
+# RSI of days whose 50-day window is full are computed as a linear filter,
+# which differs from smoothing day by day by rounding only (at most 4.3e-14
+# on 8000-day charts)
+TOLERANCE = 1e-12
+
+
+def make_chart(n: int, seed: int = 0) -> List[StockRow]:
+    rng = Random(seed)
+    price = 100.0
+    chart = []
+    for i in range(n):
+        price = round(price * (1 + rng.gauss(0, 0.03)), 2)
+        chart.append(StockRow(f"d{i:05d}", price, price))
+
+    return chart
+
+
+def reference_dca_rsi(full_chart: List[StockRow]) -> Dict[str, float]:
+    # The windowed loop compute_dca_rsi replaced, re-smoothing the last 50
+    # differences every day
+    prices = [c.close_price for c in full_chart]
+    dates = [c.date for c in full_chart]
+
+    term = 14
+    range_val = 50
+    rsi_dict = {}
+
+    diffs = [prices[i + 1] - prices[i] for i in range(len(prices) - 1)]
+
+    for i in range(len(full_chart)):
+        date = dates[i]
+        if i < term:
+            rsi_dict[date] = 50.0
+            continue
+
+        start_diff_idx = max(i - range_val, 0)
+        d_slice = diffs[start_diff_idx:i]
+
+        if len(d_slice) <= term:
+            t = len(d_slice)
+            initial_slice = d_slice
+        else:
+            t = term
+            initial_slice = d_slice[:term]
+
+        up = sum(d for d in initial_slice if d > 0) / term
+        down = sum(-d for d in initial_slice if d < 0) / term
+
+        for d in d_slice[t:]:
+            up = (up * 13 + (d if d > 0 else 0.0)) / 14
+            down = (down * 13 + (-d if d < 0 else 0.0)) / 14
+
+        if up + down == 0:
+            rsi_dict[date] = 50.0
+        else:
+            rsi_dict[date] = 100.0 * (up / (up + down))
+
+    return rsi_dict
+
+
+@pytest.mark.parametrize("n", [0, 1, 10, 14, 15, 50, 51])
+def test_growing_window_is_exact(n):
+    chart = make_chart(n)
+
+    assert compute_dca_rsi(chart) == reference_dca_rsi(chart)
+
+
+@pytest.mark.parametrize("n", [52, 3000])
+def test_full_window_within_tolerance(n):
+    chart = make_chart(n, seed=1)
+    rsis, expected = compute_dca_rsi(chart), reference_dca_rsi(chart)
+
+    assert list(rsis.keys()) == list(expected.keys())
+    for date, rsi in rsis.items():
+        assert rsi == pytest.approx(expected[date], rel=0, abs=TOLERANCE)
+
+
+def test_flat_chart():
+    chart = [StockRow(f"d{i:05d}", 10.0, 10.0) for i in range(60)]
+
+    assert compute_dca_rsi(chart) == reference_dca_rsi(chart)
@@ -0,0 +1,123 @@
+import sys
+from datetime import date, timedelta
+from random import Random
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pytest
+
+from src.const import Result
+from src.env import CYCLE_DAYS, MAX_CYCLES
+from src.test import (
+    compute_fail_rate,
+    _date_results,
+    _min_fail_rates,
+    _weights,
+)
+
+DATES = [
+    (date(2000, 1, 3) + timedelta(days=i)).isoformat() for i in range(4000)
+]
+
+
+def make_windows(
+    n: int, seed: int
+) -> List[Tuple[int, int, int, bool]]:
+    # (start, cycle, end, sold) of windows on a random subset of days, as
+    # if filtered by sahm_threshold, that sell or fail in their last cycle
+    rng = Random(seed)
+    starts = sorted(rng.sample(range(n), n * 3 // 4))
+
+    windows = []
+    for start in starts:
+        cycle = rng.randrange(MAX_CYCLES)
+        last = cycle == MAX_CYCLES - 1
+        sold = not last or rng.random() < 0.7
+        offset = rng.randrange(
+            max(cycle * CYCLE_DAYS, 1), (cycle + 1) * CYCLE_DAYS
+        )
+        windows.append((start, cycle, start + offset, sold))
+
+    return windows
+
+
+def to_results(windows: List[Tuple[int, int, int, bool]]) -> Dict[int, List[Result]]:
+    # Windows failed every cycle before the one they ended in
+    results = {cycle: [] for cycle in range(MAX_CYCLES)}
+    for start, cycle, end, sold in windows:
+        for c in range(cycle):
+            failed = start + (c + 1) * CYCLE_DAYS - 1
+            results[c].append(Result(DATES[start], DATES[failed], False, 0.0))
+        results[cycle].append(Result(DATES[start], DATES[end], sold, 0.0))
+
+    return results
+
+
+def reference_weights(date_results: Dict[str, Result]) -> List[float]:
+    # Weights of the starts in date order by definition, O(n * CYCLE_DAYS)
+    sorted_dates = sorted(list(date_results.keys()))
+    date_idx = {d: i for i, d in enumerate(sorted_dates)}
+
+    weights = []
+    for i, start in enumerate(sorted_dates):
+        last_cycle_dates = sorted_dates[max(i - CYCLE_DAYS, 0) : i]
+
+        end_in_start: Dict[str, int] = {}
+        for d in reversed(last_cycle_dates):
+            res = date_results[d]
+
+            e = date_idx.get(res.end, sys.maxsize)
+            s = date_idx.get(start)
+
+            end_in_start[d] = int(abs(e - s) <= 1) or end_in_start.get(
+                res.end, 0
+            )
+
+        weight = (
+            sum(end_in_start.values()) / len(end_in_start)
+            if end_in_start
+            else 0.5
+        )
+        weights.append(weight)
+
+    return weights
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_weights(seed: int):
+    rng = Random(seed)
+    windows = make_windows(rng.randrange(1, 800), seed)
+    date_results = _date_results(to_results(windows))
+
+    starts = sorted(date_results.keys())
+    weights = _weights(starts, [date_results[d].end for d in starts])
+
+    assert np.array_equal(weights, reference_weights(date_results))
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_min_fail_rates(seed: int):
+    configs = [make_windows(600, seed * 10 + k) for k in range(3)]
+    rates = [compute_fail_rate(to_results(windows)) for windows in configs]
+
+    # Steps of the last cycle, the last one with every window ended
+    for step in (
+        *range((MAX_CYCLES - 1) * CYCLE_DAYS + 1, MAX_CYCLES * CYCLE_DAYS, 7),
+        MAX_CYCLES * CYCLE_DAYS,
+    ):
+        rows = []
+        for k, windows in enumerate(configs):
+            for start, cycle, end, sold in windows:
+                last = cycle == MAX_CYCLES - 1
+                running = last and end - start >= step
+                end = start + step if running else end
+                rows.append((k, start, end, sold and not running, running))
+
+        bounds = _min_fail_rates(
+            len(configs), *(np.array(column) for column in zip(*rows))
+        )
+
+        if step == MAX_CYCLES * CYCLE_DAYS:
+            assert bounds == pytest.approx(rates, rel=1e-12)
+        else:
+            assert np.all(bounds <= np.array(rates) * (1 + 1e-12))